@@ -8,7 +8,8 @@ def main():
     parser.add_argument("video_path", help="Path to the input video file")
     parser.add_argument("--lang", default=None, help="Target language code (e.g., es, fr, de, it)")
     parser.add_argument("--tone", default=None, help="Tone preference (optional)")
-    parser.add_argument("--service", default=None, help="Translation service: 'openrouter', 'mistral', 'google'")
+    parser.add_argument("--service", default=None, help="Translation service: 'openrouter', 'mistral', 'google', 'mock'")
+    parser.add_argument("--transcript", default=None, help="Existing transcript JSON (from a previous run) to skip transcription")
     
     args = parser.parse_args()
     
@@ -39,7 +40,8 @@ def main():
             video_path=args.video_path,
             target_language=target_lang,
             tone_preference=args.tone,
-            translation_service=args.service
+            translation_service=args.service,
+            transcript_path=args.transcript
         )
         print(f"\nSUCCESS! Dubbed video saved to:\n{final_path}")
     except Exception as e:
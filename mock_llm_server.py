@@ -0,0 +1,165 @@
+"""
+Local stand-in for the OpenAI-compatible chat completions endpoint used by the Translator.
+Lets translation chunking, concurrency, retries and fallback be load-tested offline.
+
+    python mock_llm_server.py --port 8765 --latency 0.5 --rate-limit-prob 0.1 --malformed-prob 0.05
+    TRANSLATION_SERVICE=mock python main.py video.mp4 --lang es
+
+Replies echo each requested line as "[<lang>] <text>" keyed by line ID, in the JSON
+format the Translator asks for. Failures are decided per request from --seed, the request
+body and how many times that body was seen, so a run is reproducible regardless of
+thread scheduling (and a retried request can succeed).
+"""
+import re
+import json
+import time
+import random
+import hashlib
+import argparse
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+LINE_PATTERN = re.compile(r"^(\d+):\s*\[[^\]]*\]\s*(.*)$")
+LANGUAGE_PATTERN = re.compile(r"(?:lines to|working in) (\S+?)[.\s]")
+
+
+class MockState:
+    def __init__(self, args):
+        self.args = args
+        self.seen = {}
+        self.lock = threading.Lock()
+        self.stats = {"requests": 0, "ok": 0, "rate_limited": 0, "malformed": 0}
+
+    def rng_for(self, body):
+        digest = hashlib.sha256(body).hexdigest()
+        with self.lock:
+            attempt = self.seen.get(digest, 0)
+            self.seen[digest] = attempt + 1
+        return random.Random(f"{self.args.seed}:{digest}:{attempt}")
+
+    def count(self, key):
+        with self.lock:
+            self.stats["requests"] += 1
+            self.stats[key] += 1
+
+
+def build_reply(messages, rng, drop_prob):
+    """{line_id: translation} for the lines the request asks for."""
+    system = next((m["content"] for m in messages if m["role"] == "system"), "")
+    user = next((m["content"] for m in reversed(messages) if m["role"] == "user"), "")
+    match = LANGUAGE_PATTERN.search(system)
+    language = match.group(1) if match else "xx"
+
+    # Context lines are shown for continuity only; translate what follows TRANSLATE:
+    body = user.split("TRANSLATE:", 1)[1] if "TRANSLATE:" in user else user
+    reply = {}
+    for line in body.splitlines():
+        match = LINE_PATTERN.match(line.strip())
+        if not match or rng.random() < drop_prob:
+            continue
+        line_id, text = match.groups()
+        if "| Translation:" in text:
+            # Shortening request: answer with a trimmed version of the current translation
+            current = text.split("| Translation:", 1)[1].strip()
+            reply[line_id] = current[:max(1, len(current) * 2 // 3)]
+        else:
+            reply[line_id] = f"[{language}] {text}"
+    return reply
+
+
+def make_handler(state):
+    args = state.args
+
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, format, *log_args):
+            if args.verbose:
+                super().log_message(format, *log_args)
+
+        def _send(self, status, payload, raw=None):
+            data = raw if raw is not None else json.dumps(payload).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            if status == 429:
+                self.send_header("Retry-After", "1")
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):
+            if self.path.rstrip("/").endswith("/stats"):
+                self._send(200, state.stats)
+            else:
+                self._send(404, {"error": {"message": "Not found"}})
+
+        def do_POST(self):
+            if not self.path.rstrip("/").endswith("/chat/completions"):
+                self._send(404, {"error": {"message": "Not found"}})
+                return
+
+            body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            rng = state.rng_for(body)
+            try:
+                request = json.loads(body)
+            except ValueError:
+                self._send(400, {"error": {"message": "Invalid JSON body", "type": "invalid_request_error"}})
+                return
+
+            if rng.random() < args.rate_limit_prob:
+                state.count("rate_limited")
+                self._send(429, {"error": {"message": "Rate limit exceeded (mock)", "type": "rate_limit_error", "code": "rate_limit_exceeded"}})
+                return
+
+            reply = build_reply(request.get("messages", []), rng, args.drop_prob)
+            time.sleep(max(0.0, rng.gauss(args.latency, args.jitter)) + args.latency_per_line * len(reply))
+
+            content = json.dumps(reply, ensure_ascii=False)
+            if rng.random() < args.malformed_prob:
+                state.count("malformed")
+                content = content[:max(1, len(content) // 2)] # Truncated JSON, like a cut-off generation
+            else:
+                state.count("ok")
+
+            self._send(200, {
+                "id": f"chatcmpl-mock-{rng.getrandbits(32):08x}",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": request.get("model", "mock"),
+                "choices": [{
+                    "index": 0,
+                    "message": {"role": "assistant", "content": content},
+                    "finish_reason": "stop"
+                }],
+                "usage": {"prompt_tokens": len(body) // 4, "completion_tokens": len(content) // 4, "total_tokens": (len(body) + len(content)) // 4}
+            })
+
+    return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Mock OpenAI-compatible translation server for offline load testing")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.5, help="Mean base latency per request (seconds)")
+    parser.add_argument("--jitter", type=float, default=0.1, help="Std-dev of the base latency (seconds)")
+    parser.add_argument("--latency-per-line", type=float, default=0.02, help="Extra latency per returned line (seconds)")
+    parser.add_argument("--rate-limit-prob", type=float, default=0.0, help="Probability of answering 429")
+    parser.add_argument("--malformed-prob", type=float, default=0.0, help="Probability of truncated (invalid) JSON content")
+    parser.add_argument("--drop-prob", type=float, default=0.0, help="Probability of omitting each requested line")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--verbose", action="store_true", help="Log every request")
+    args = parser.parse_args()
+
+    state = MockState(args)
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(state))
+    print(f"Mock LLM server on http://{args.host}:{args.port}/v1 (stats at /v1/stats)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        print(f"Stats: {state.stats}")
+
+
+if __name__ == "__main__":
+    main()
@@ -50,6 +50,10 @@ parser.add_argument('--rotate', default=False, action='store_true',
 parser.add_argument('--nosmooth', default=False, action='store_true',
 					help='Prevent smoothing face detections over a short temporal window')
 
+parser.add_argument('--speech_regions', type=str, default=None,
+					help='JSON file with {"regions": [[start, end], ...]} in seconds. Frames outside these regions '
+					'skip face detection and the model and are written unchanged')
+
 args = parser.parse_args()
 args.img_size = 96
 
@@ -105,20 +109,25 @@ def face_detect(images):
 	del detector
 	return results 
 
-def datagen(frames, mels):
-	img_batch, mel_batch, frame_batch, coords_batch = [], [], [], []
+def datagen(frames, mels, indices=None):
+	img_batch, mel_batch, frame_batch, coords_batch, index_batch = [], [], [], [], []
+	if indices is None:
+		indices = range(len(mels))
 
 	if args.box[0] == -1:
 		if not args.static:
-			face_det_results = face_detect(frames) # BGR2RGB for CNN face detection
+			# Only detect faces on the frames that will actually be lip-synced
+			needed = sorted(set(i % len(frames) for i in indices))
+			face_det_results = dict(zip(needed, face_detect([frames[i] for i in needed]))) # BGR2RGB for CNN face detection
 		else:
-			face_det_results = face_detect([frames[0]])
+			face_det_results = {0: face_detect([frames[0]])[0]}
 	else:
 		print('Using the specified bounding box instead of face detection...')
 		y1, y2, x1, x2 = args.box
-		face_det_results = [[f[y1: y2, x1:x2], (y1, y2, x1, x2)] for f in frames]
+		face_det_results = {i: [f[y1: y2, x1:x2], (y1, y2, x1, x2)] for i, f in enumerate(frames)}
 
-	for i, m in enumerate(mels):
+	for i in indices:
+		m = mels[i]
 		idx = 0 if args.static else i%len(frames)
 		frame_to_save = frames[idx].copy()
 		face, coords = face_det_results[idx].copy()
@@ -129,6 +138,7 @@ def datagen(frames, mels):
 		mel_batch.append(m)
 		frame_batch.append(frame_to_save)
 		coords_batch.append(coords)
+		index_batch.append(i)
 
 		if len(img_batch) >= args.wav2lip_batch_size:
 			img_batch, mel_batch = np.asarray(img_batch), np.asarray(mel_batch)
@@ -139,8 +149,8 @@ def datagen(frames, mels):
 			img_batch = np.concatenate((img_masked, img_batch), axis=3) / 255.
 			mel_batch = np.reshape(mel_batch, [len(mel_batch), mel_batch.shape[1], mel_batch.shape[2], 1])
 
-			yield img_batch, mel_batch, frame_batch, coords_batch
-			img_batch, mel_batch, frame_batch, coords_batch = [], [], [], []
+			yield img_batch, mel_batch, frame_batch, coords_batch, index_batch
+			img_batch, mel_batch, frame_batch, coords_batch, index_batch = [], [], [], [], []
 
 	if len(img_batch) > 0:
 		img_batch, mel_batch = np.asarray(img_batch), np.asarray(mel_batch)
@@ -151,7 +161,21 @@ def datagen(frames, mels):
 		img_batch = np.concatenate((img_masked, img_batch), axis=3) / 255.
 		mel_batch = np.reshape(mel_batch, [len(mel_batch), mel_batch.shape[1], mel_batch.shape[2], 1])
 
-		yield img_batch, mel_batch, frame_batch, coords_batch
+		yield img_batch, mel_batch, frame_batch, coords_batch, index_batch
+
+def speech_frame_indices(num_frames, fps):
+	if not args.speech_regions:
+		return None
+	with open(args.speech_regions) as f:
+		regions = json.load(f)["regions"]
+	starts = np.array([r[0] for r in regions])
+	ends = np.array([r[1] for r in regions])
+	times = np.arange(num_frames) / fps
+	pos = np.searchsorted(starts, times, side='right') - 1
+	in_speech = (pos >= 0) & (times < ends[np.clip(pos, 0, None)]) if len(regions) else np.zeros(num_frames, dtype=bool)
+	indices = np.nonzero(in_speech)[0].tolist()
+	print('Speech frames: {}/{} (others are passed through)'.format(len(indices), num_frames))
+	return indices
 
 mel_step_size = 16
 device = 'cuda' if torch.cuda.is_available() else 'cpu'
@@ -244,18 +268,26 @@ def main():
 	full_frames = full_frames[:len(mel_chunks)]
 
 	batch_size = args.wav2lip_batch_size
-	gen = datagen(full_frames.copy(), mel_chunks)
-
-	for i, (img_batch, mel_batch, frames, coords) in enumerate(tqdm(gen, 
-											total=int(np.ceil(float(len(mel_chunks))/batch_size)))):
+	indices = speech_frame_indices(len(mel_chunks), fps)
+	gen = datagen(full_frames.copy(), mel_chunks, indices)
+
+	frame_h, frame_w = full_frames[0].shape[:-1]
+	out = cv2.VideoWriter('temp/result.avi', 
+							cv2.VideoWriter_fourcc(*'DIVX'), fps, (frame_w, frame_h))
+	next_frame = 0
+
+	def write_passthrough(until):
+		# Frames outside speech are written unchanged
+		for j in range(next_frame, until):
+			out.write(full_frames[0 if args.static else j % len(full_frames)])
+
+	num_synced = len(mel_chunks) if indices is None else len(indices)
+	for i, (img_batch, mel_batch, frames, coords, frame_indices) in enumerate(tqdm(gen, 
+											total=int(np.ceil(float(num_synced)/batch_size)))):
 		if i == 0:
 			model = load_model(args.checkpoint_path)
 			print ("Model loaded")
 
-			frame_h, frame_w = full_frames[0].shape[:-1]
-			out = cv2.VideoWriter('temp/result.avi', 
-									cv2.VideoWriter_fourcc(*'DIVX'), fps, (frame_w, frame_h))
-
 		img_batch = torch.FloatTensor(np.transpose(img_batch, (0, 3, 1, 2))).to(device)
 		mel_batch = torch.FloatTensor(np.transpose(mel_batch, (0, 3, 1, 2))).to(device)
 
@@ -264,13 +296,16 @@ def main():
 
 		pred = pred.cpu().numpy().transpose(0, 2, 3, 1) * 255.
 		
-		for p, f, c in zip(pred, frames, coords):
+		for p, f, c, frame_idx in zip(pred, frames, coords, frame_indices):
+			write_passthrough(frame_idx)
 			y1, y2, x1, x2 = c
 			p = cv2.resize(p.astype(np.uint8), (x2 - x1, y2 - y1))
 
 			f[y1:y2, x1:x2] = p
 			out.write(f)
+			next_frame = frame_idx + 1
 
+	write_passthrough(len(mel_chunks))
 	out.release()
 
 	command = 'ffmpeg -y -i {} -i {} -strict -2 -q:v 1 {}'.format(args.audio, 'temp/result.avi', args.outfile)
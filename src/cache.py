@@ -0,0 +1,26 @@
+import os
+import json
+import hashlib
+from src.config import Config
+
+
+def file_hash(path, chunk_size=1 << 20):
+    """SHA-256 of a file's contents (streamed, so large audio files are fine)."""
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(chunk_size), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def make_key(*parts):
+    """Stable hash of arbitrary JSON-serialisable parts (content hashes, option dicts, ...)."""
+    blob = json.dumps(parts, sort_keys=True, default=str)
+    return hashlib.sha256(blob.encode('utf-8')).hexdigest()
+
+
+def cache_path(namespace, key, ext=""):
+    """Path for a cache entry under Config.CACHE_DIR/<namespace>/."""
+    directory = os.path.join(Config.CACHE_DIR, namespace)
+    os.makedirs(directory, exist_ok=True)
+    return os.path.join(directory, f"{key}{ext}")
@@ -20,18 +20,79 @@ class Config:
     # Let's interpret "save it in bgm folder" as a top level folder or inside output.
     # To be safe and organized:
     BGM_DIR = os.path.join(BASE_DIR, "bgm")
+    CACHE_DIR = os.path.join(BASE_DIR, "cache") # Persistent across jobs (not removed by cleanup)
     
     # Model Configurations
     WHISPER_MODEL_SIZE = "base"
     WHISPER_MODEL_SIZE = "base"
     DEMUCS_MODEL = "mdx_extra_q" # 'htdemucs' (fast) < 'htdemucs_ft' < 'mdx_extra_q' (Best Vocal Isolation) 
+
+    # Speech Recognition (ASR)
+    ASR_BACKEND = os.getenv("ASR_BACKEND", "whisper") # 'whisper' (openai-whisper, fp32) or 'faster-whisper' (CTranslate2, quantized)
+    ASR_COMPUTE_TYPE = os.getenv("ASR_COMPUTE_TYPE", "int8") # faster-whisper only: 'int8' (fastest on CPU), 'int8_float16', 'float16', 'float32'
+
+    # Voice Activity Detection (skip silence / music-only parts before ASR)
+    USE_VAD = True
+    VAD_TOP_DB = 40 # Frames quieter than (peak - top_db) dB count as silence
+    VAD_MIN_SPEECH = 0.25 # Drop speech regions shorter than this (seconds)
+    VAD_MIN_SILENCE = 0.6 # Merge regions separated by pauses shorter than this (seconds)
+    VAD_PAD = 0.2 # Padding added around each speech region (seconds)
+    ASR_WORKERS = int(os.getenv("ASR_WORKERS", "1")) # >1 = transcribe chunks in parallel processes (CPU only, one model each)
+    ASR_CHUNK_SECONDS = 300 # Max span per parallel chunk; chunks are cut at silences
+    WORD_TIMESTAMPS = True # Trim segments to spoken words and split over-long ones
+    MAX_SEGMENT_SECONDS = 10.0 # Segments longer than this are split at a word boundary
+    USE_TRANSCRIPT_CACHE = True # Reuse transcripts of identical audio (keyed by content hash + options)
     
     # Diarization
     # You might need to set your HF token as an env var: HF_TOKEN
     USE_DIARIZATION = True
+    DIARIZATION_MODE = os.getenv("DIARIZATION_MODE", "pyannote") # 'pyannote' (best, needs HF_TOKEN), 'lite' (offline, CPU-fast), 'off'
+    LITE_DIARIZATION_THRESHOLD = 0.2 # Lite mode: cosine similarity to merge voice clusters (higher = more speakers)
+    LITE_NUM_SPEAKERS = None # Lite mode: force a speaker count instead of the threshold
+    DIARIZATION_WINDOW_SECONDS = 900 # Longer recordings are diarized in windows (bounded memory); 0 = always whole file
+    DIARIZATION_WINDOW_OVERLAP = 30 # Seconds shared by neighbouring windows
+    DIARIZATION_LINK_THRESHOLD = None # Embedding similarity to link speakers across windows; None = embedder default
+    SPEAKER_EMBEDDING_BACKEND = "auto" # 'pyannote' (needs HF_TOKEN), 'mfcc' (offline), 'auto' = pyannote if token
+
+    # Voice Bank (recurring speakers across videos reuse their stored reference)
+    # Opt-in: it stores people's voice clips, and matching needs pyannote embeddings (HF_TOKEN)
+    USE_VOICE_BANK = os.getenv("USE_VOICE_BANK", "false").lower() == "true"
+    VOICE_BANK_DIR = os.path.join(BASE_DIR, "voice_bank")
+    VOICE_BANK_THRESHOLD = None # Cosine similarity to match a known voice; None = embedder default
+
+    # Reference Cleaning
+    CLEAN_CACHE_MAX_MB = 500 # Cleaned references kept in CACHE_DIR/clean (least recently used are removed)
+    CLEAN_WORKERS = None # Parallel reference cleaning threads; None = one per speaker (up to CPU count)
+    CLEAN_BLOCK_SECONDS = 30 # Longer inputs are cleaned block-wise at constant memory
+    CLEAN_BLOCK_MARGIN = 1.0 # Seconds of context on each side of a block (discarded after gating)
+    CLEAN_VOCALS_FOR_ASR = os.getenv("CLEAN_VOCALS_FOR_ASR", "false").lower() == "true" # Denoise the full vocal track before ASR
+
+    # Speech Synthesis
+    TTS_BATCH_SIZE = 16 # Translated segments buffered per synthesis batch (grouped by speaker, then text length)
+    TTS_WORKERS = int(os.getenv("TTS_WORKERS", "1")) # CPU only: 1 = sequential in-process, 0 = auto (from cores and RAM), N = worker processes
+    TTS_WORKER_RAM_GB = 4.0 # Memory budget per TTS worker process (each loads its own engine)
+    TTS_MIN_THREADS_PER_WORKER = 4 # Auto mode keeps at least this many torch threads per worker
+    TTS_CONDITIONING_CACHE = True # Persist per-reference speaker conditioning (XTTS latents / Chatterbox conds) under CACHE_DIR
+
+    # Emotion Analysis
+    EMOTION_ANALYSIS = "auto" # 'auto' (only when the TTS engine uses emotion/prosody), 'always', 'never'
+    EMOTION_RUNTIME = os.getenv("EMOTION_RUNTIME", "fp32") # 'fp32', 'int8' (dynamic quantization, CPU), 'onnx' (onnxruntime via optimum)
+    EMOTION_BATCH_SIZE = 16 # Segments per wav2vec2 forward pass (length-bucketed)
+    PROSODY_MODE = "fast" # 'fast' (whole-track YIN, sliced per segment) or 'accurate' (per-segment pyin)
 
     # Translation (LLM)
-    TRANSLATION_SERVICE = os.getenv("TRANSLATION_SERVICE", "mistral") # 'openrouter', 'mistral', 'google'
+    TRANSLATION_SERVICE = os.getenv("TRANSLATION_SERVICE", "mistral") # 'openrouter', 'mistral', 'google', 'mock'
+    TRANSLATION_CHUNK_TOKENS = 1500 # Prompt budget per LLM request (estimated at ~4 chars/token)
+    TRANSLATION_CONTEXT_LINES = 3 # Preceding lines sent with each chunk for continuity (not translated)
+    TRANSLATION_MAX_WORKERS = 4 # Concurrent chunk requests
+    TRANSLATION_RPM = int(os.getenv("TRANSLATION_RPM", "0")) # Requests per minute cap across workers; 0 = unlimited
+    TRANSLATION_MAX_RETRIES = 2 # Per-chunk retries before its missing lines fall back to Google
+    USE_TRANSLATION_MEMORY = os.getenv("USE_TRANSLATION_MEMORY", "true").lower() == "true" # Reuse past translations of identical lines
+    TRANSLATION_MEMORY_PATH = os.path.join(CACHE_DIR, "translation_memory.sqlite")
+    GOOGLE_BATCH_CHARS = 4500 # Google fallback: lines joined per request (service limit is 5000)
+    GOOGLE_MAX_WORKERS = 4 # Concurrent Google fallback requests
+    DURATION_AWARE_TRANSLATION = True # Predict spoken length and re-request shorter wording for overrunning lines (LLM only)
+    TRANSLATION_MAX_OVERFLOW = 1.3 # Predicted duration / slot above which a line is re-translated
     
     # OpenRouter
     OPENROUTER_API_KEY = os.getenv("OPENROUTER_API_KEY")
@@ -40,6 +101,10 @@ class Config:
     # Mistral
     MISTRAL_API_KEY = os.getenv("MISTRAL_API_KEY")
     MISTRAL_MODEL = "mistral-small-latest" # Good balance of speed/quality
+
+    # Mock (offline load testing: python mock_llm_server.py)
+    MOCK_LLM_BASE_URL = os.getenv("MOCK_LLM_BASE_URL", "http://127.0.0.1:8765/v1")
+    MOCK_LLM_MODEL = "mock-translator"
     
     
     # Dubbing Settings
@@ -52,3 +117,4 @@ class Config:
         os.makedirs(cls.OUTPUT_DIR, exist_ok=True)
         os.makedirs(cls.TEMP_DIR, exist_ok=True)
         os.makedirs(cls.BGM_DIR, exist_ok=True)
+        os.makedirs(cls.CACHE_DIR, exist_ok=True)
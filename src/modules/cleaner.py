@@ -2,56 +2,226 @@ import os
 import noisereduce as nr
 import scipy.io.wavfile as wav
 import numpy as np
-from scipy.signal import butter, lfilter
+from scipy.signal import butter, sosfilt, sosfilt_zi
 import librosa
 import soundfile as sf
+import shutil
+import threading
+import concurrent.futures
 from src.config import Config
+from src.cache import file_hash, make_key, cache_path
+
+_prune_lock = threading.Lock()
+
+
+def _part_path(path):
+    """Unique temp name next to `path` (per process and thread)."""
+    return f"{path}.{os.getpid()}_{threading.get_ident()}.part.wav"
+
 
 class AudioCleaner:
+    # Cleaning parameters (also part of the cache key)
+    PROP_DECREASE = 0.75
+    HIGHPASS_CUTOFF = 100
+    HIGHPASS_ORDER = 5
+    NOISE_PROFILE_SECONDS = 2.0 # Quietest audio kept as the streaming noise profile
+
     def __init__(self, output_dir="temp"):
         self.output_dir = output_dir
         os.makedirs(self.output_dir, exist_ok=True)
 
-    def clean_audio(self, audio_path, suffix="_clean"):
+    def clean_array(self, data, rate):
         """
-        Applies cleaning pipeline:
+        Applies cleaning pipeline to an in-memory mono waveform:
         1. Spectral Gating (removes hiss/static)
         2. High-Pass Filter (removes rumble < 100Hz)
         """
+        # 1. Noise Reduction (Spectral Gating)
+        # Assuming noise is stationary (like hiss), we can estimate it from the whole clip
+        # prop_decrease=0.8 means remove 80% of noise (conservative to avoid artifacts)
+        reduced_noise = self._reduce_noise(data, rate)
+
+        # 2. High-Pass Filter (Remove Rumble)
+        return self._highpass_filter(reduced_noise, cutoff=self.HIGHPASS_CUTOFF, fs=rate, order=self.HIGHPASS_ORDER)
+
+    def clean_audio(self, audio_path, suffix="_clean", use_cache=True):
+        """
+        Cleans a file (see clean_array) into output_dir. A copy is kept in CACHE_DIR/clean,
+        keyed by input content hash and cleaning parameters, so an identical reference is
+        never cleaned twice (the cache is pruned to CLEAN_CACHE_MAX_MB, least recently used first).
+        use_cache=False for large job-specific inputs (e.g. a full vocal track) that would
+        only crowd out the references.
+        Returns the path of the cleaned file (or the original on failure).
+        """
         try:
             filename = os.path.basename(audio_path).split('.')[0]
             output_path = os.path.join(self.output_dir, f"{filename}{suffix}.wav")
-            
+
+            # Long input (merged references, full tracks) is cleaned block-wise, which gives
+            # different output: the path taken and its parameters are part of the cache key
+            info = sf.info(audio_path)
+            streamed = info.frames > Config.CLEAN_BLOCK_SECONDS * info.samplerate
+
+            cached_path = None
+            if use_cache:
+                params = [self.PROP_DECREASE, self.HIGHPASS_CUTOFF, self.HIGHPASS_ORDER]
+                if streamed:
+                    params += ["stream", Config.CLEAN_BLOCK_SECONDS, Config.CLEAN_BLOCK_MARGIN, self.NOISE_PROFILE_SECONDS]
+                key = make_key(file_hash(audio_path), *params)
+                cached_path = cache_path("clean", key, ".wav")
+            if cached_path and os.path.exists(cached_path):
+                print(f"Cleaning audio: {filename} (cached)")
+                self._copy_atomic(cached_path, output_path)
+                os.utime(cached_path) # Recently used: pruned last
+                return output_path
+
             print(f"Cleaning audio: {filename}...")
-            
-            # Load audio using librosa (handles various formats better, resampling to 24k is fine for cloning)
-            # But for noisereduce, maintaining sample rate is good.
-            data, rate = librosa.load(audio_path, sr=None)
-            
-            # 1. Noise Reduction (Spectral Gating)
-            # Assuming noise is stationary (like hiss), we can estimate it from the whole clip
-            # prop_decrease=0.8 means remove 80% of noise (conservative to avoid artifacts)
-            reduced_noise = nr.reduce_noise(y=data, sr=rate, prop_decrease=0.75, stationary=True)
-            
-            # 2. High-Pass Filter (Remove Rumble)
-            filtered_audio = self._highpass_filter(reduced_noise, cutoff=100, fs=rate)
-            
-            # Save
-            sf.write(output_path, filtered_audio, rate)
+
+            # Write to a temp name first so a crash never leaves a half-written file
+            tmp_path = _part_path(output_path)
+            if streamed:
+                # Constant-memory block processing
+                self.clean_stream(audio_path, tmp_path)
+            else:
+                # soundfile reads WAV directly (no resampling); noisereduce keeps the native rate
+                data, rate = sf.read(audio_path, dtype='float32', always_2d=True)
+                sf.write(tmp_path, self.clean_array(data.mean(axis=1), rate), rate)
+            os.replace(tmp_path, output_path)
             print(f"  -> Cleaned saved to: {output_path}")
-            
+
+            if cached_path:
+                self._copy_atomic(output_path, cached_path)
+                self._prune_cache()
             return output_path
-            
+
         except Exception as e:
             print(f"[WARNING] Audio cleaning failed: {e}. Returning original.")
             return audio_path
 
+    @staticmethod
+    def _copy_atomic(src_path, dst_path):
+        tmp_path = _part_path(dst_path)
+        shutil.copyfile(src_path, tmp_path)
+        os.replace(tmp_path, dst_path)
+
+    def _prune_cache(self):
+        """Deletes the least recently used cleaned files until CACHE_DIR/clean fits CLEAN_CACHE_MAX_MB."""
+        directory = os.path.join(Config.CACHE_DIR, "clean")
+        limit = Config.CLEAN_CACHE_MAX_MB * 1024 * 1024
+        with _prune_lock:
+            entries = []
+            for name in os.listdir(directory):
+                path = os.path.join(directory, name)
+                if name.endswith(".part.wav"):
+                    continue # Being written by another thread
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+
+            total = sum(size for _, size, _ in entries)
+            for _, size, path in sorted(entries):
+                if total <= limit:
+                    break
+                try:
+                    os.remove(path)
+                    total -= size
+                except OSError:
+                    pass
+
+    def clean_many(self, audio_paths, suffix="_clean", max_workers=None):
+        """
+        Cleans several files concurrently (NumPy/SciPy FFTs release the GIL).
+        Returns cleaned paths in input order.
+        """
+        if not audio_paths:
+            return []
+        unique = list(dict.fromkeys(audio_paths)) # Each distinct file is cleaned once
+        workers = max_workers or Config.CLEAN_WORKERS or min(len(unique), os.cpu_count() or 1)
+        with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+            cleaned = dict(zip(unique, executor.map(lambda path: self.clean_audio(path, suffix=suffix), unique)))
+        return [cleaned[path] for path in audio_paths]
+
+    def clean_stream(self, audio_path, output_path, block_seconds=None, margin_seconds=None):
+        """
+        Streaming version of clean_array for arbitrary-length input at constant memory.
+        The noise profile is estimated once (quietest parts of the whole file), then fixed-size
+        blocks are gated with a margin of context on both sides (discarded after gating, so there
+        are no STFT edge artifacts) and high-passed with second-order sections whose filter
+        state is carried from block to block.
+        """
+        block_seconds = block_seconds or Config.CLEAN_BLOCK_SECONDS
+        margin_seconds = margin_seconds if margin_seconds is not None else Config.CLEAN_BLOCK_MARGIN
+
+        with sf.SoundFile(audio_path) as src:
+            rate = src.samplerate
+            block = int(block_seconds * rate)
+            margin = int(margin_seconds * rate)
+            noise = self._estimate_noise_profile(src, rate)
+
+            sos = self._highpass_sos(rate)
+            zi = None
+
+            with sf.SoundFile(output_path, 'w', samplerate=rate, channels=1) as dst:
+                for start in range(0, src.frames, block):
+                    stop = min(start + block, src.frames)
+                    lo, hi = max(0, start - margin), min(src.frames, stop + margin)
+                    src.seek(lo)
+                    chunk = src.read(hi - lo, dtype='float32', always_2d=True).mean(axis=1)
+
+                    reduced = self._reduce_noise(chunk, rate, noise)[start - lo:stop - lo]
+                    if zi is None:
+                        # Start from steady state for the first sample (no onset click)
+                        zi = sosfilt_zi(sos) * reduced[0]
+                    filtered, zi = sosfilt(sos, reduced, zi=zi)
+                    dst.write(filtered.astype(np.float32))
+
+        return output_path
+
+    def _estimate_noise_profile(self, src, rate, piece_seconds=0.5):
+        """
+        One pass over an open SoundFile keeping only the quietest pieces (by RMS),
+        so the profile costs NOISE_PROFILE_SECONDS of memory whatever the file length.
+        """
+        piece = max(1, int(piece_seconds * rate))
+        keep = max(1, int(self.NOISE_PROFILE_SECONDS / piece_seconds))
+        quietest = [] # (rms, samples), at most `keep` entries
+
+        src.seek(0)
+        for chunk in src.blocks(blocksize=piece, dtype='float32', always_2d=True):
+            chunk = chunk.mean(axis=1)
+            if len(chunk) < piece:
+                continue
+            rms = float(np.sqrt(np.mean(chunk ** 2)))
+            if rms == 0.0:
+                continue # Digital silence says nothing about the noise floor
+            if len(quietest) < keep:
+                quietest.append((rms, chunk))
+            elif rms < quietest[-1][0]:
+                quietest[-1] = (rms, chunk)
+            else:
+                continue
+            quietest.sort(key=lambda item: item[0])
+        src.seek(0)
+
+        if not quietest:
+            return None
+        return np.concatenate([samples for _, samples in quietest])
+
+    def _reduce_noise(self, data, rate, noise=None):
+        """Stationary spectral gating; `noise` is a fixed profile (otherwise estimated from `data`)."""
+        return nr.reduce_noise(y=data, sr=rate, y_noise=noise, prop_decrease=self.PROP_DECREASE, stationary=True)
+
+    def _highpass_sos(self, fs, cutoff=None, order=None):
+        nyq = 0.5 * fs
+        normal_cutoff = (cutoff or self.HIGHPASS_CUTOFF) / nyq
+        return butter(order or self.HIGHPASS_ORDER, normal_cutoff, btype='high', analog=False, output='sos')
+
     def _highpass_filter(self, data, cutoff=100, fs=44100, order=5):
         try:
-            nyq = 0.5 * fs
-            normal_cutoff = cutoff / nyq
-            b, a = butter(order, normal_cutoff, btype='high', analog=False)
-            y = lfilter(b, a, data)
+            # Second-order sections: numerically stable at low cutoffs (unlike b/a form)
+            y = sosfilt(self._highpass_sos(fs, cutoff, order), data)
             return y
         except Exception as e:
             print(f"Filter error: {e}")
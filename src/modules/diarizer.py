@@ -1,22 +1,37 @@
 import os
 import torch
-from pyannote.audio import Pipeline
+import numpy as np
+import librosa
+try:
+    from pyannote.audio import Pipeline
+except ImportError:
+    Pipeline = None # Lightweight diarization still works without pyannote
+from scipy.cluster.hierarchy import linkage, fcluster
 from src.config import Config
+from src.modules.speaker_embedding import SpeakerEmbedder
+from src.modules.vad import VoiceActivityDetector
+
+SAMPLE_RATE = 16000
 
 class SpeakerDiarizer:
     def __init__(self, auth_token=None):
         self.auth_token = auth_token or os.environ.get("HF_TOKEN")
         self.device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
         self.pipeline = None
+        self.embedder = None # Lazy Load (window linking / voice bank)
+        self.mode = Config.DIARIZATION_MODE if Config.USE_DIARIZATION else "off"
         
-        if Config.USE_DIARIZATION:
+        if self.mode == "pyannote":
             print(f"Initializing Speaker Diarizer on {self.device}...")
             
             if not self.auth_token:
-                print("\n[WARNING] HF_TOKEN is missing! Speaker Diarization will be SKIPPED.")
+                print("\n[WARNING] HF_TOKEN is missing! pyannote Speaker Diarization will be SKIPPED.")
                 print("  -> To enable: Set HF_TOKEN in .env for pyannote.audio")
-                print("  -> Continuing in Mono-Speaker Mode (all segments = SPEAKER_00)\n")
-                self.pipeline = None
+                print("  -> Continuing with lightweight CPU diarization (DIARIZATION_MODE=lite)\n")
+                self.mode = "lite"
+            elif Pipeline is None:
+                print("\n[WARNING] pyannote.audio is not installed. Using lightweight CPU diarization.\n")
+                self.mode = "lite"
             else:
                 try:
                     # Note: 'pyannote/speaker-diarization-3.1' requires acceptance of user conditions on HF
@@ -29,23 +44,42 @@ class SpeakerDiarizer:
                         self.pipeline.to(self.device)
                     else:
                         print("Warning: Could not load Diarization pipeline. Check HF_TOKEN and model access.")
+                        self.mode = "lite"
                 except Exception as e:
                     print(f"\n[ERROR] Failed to initialize Diarization pipeline: {e}")
                     print("  -> Check if you accepted the model license on Hugging Face: https://huggingface.co/pyannote/speaker-diarization-3.1")
-                    print("  -> Continuing without diarization (fallback to mono-speaker).\n")
+                    print("  -> Continuing with lightweight CPU diarization.\n")
                     self.pipeline = None
+                    self.mode = "lite"
+
+        elif self.mode == "lite":
+            print("Using lightweight CPU diarization (energy VAD + MFCC embeddings + clustering).")
 
-    def diarize(self, audio_path):
+    def diarize(self, audio_path, speech_index=None):
         """
         Returns a list of segments with speaker labels.
         Format: [{'start': 0.0, 'end': 1.5, 'speaker': 'SPEAKER_00'}, ...]
+        A shared `speech_index` lets non-speech audio be skipped cheaply.
         """
+        if self.mode == "lite":
+            return self._diarize_lite(audio_path, speech_index)
+
         if not self.pipeline:
             print("Diarizer not loaded. Skipping.")
             return []
 
+        if speech_index is not None and speech_index.total_speech == 0:
+            print("No speech in audio. Skipping diarization.")
+            return []
+
         print(f"Diarizing {audio_path}...")
         try:
+            window = Config.DIARIZATION_WINDOW_SECONDS
+            if window:
+                duration = librosa.get_duration(path=audio_path)
+                if duration > window + Config.DIARIZATION_WINDOW_OVERLAP:
+                    return self._diarize_windowed(audio_path, duration, speech_index)
+
             diarization = self.pipeline(audio_path)
             
             results = []
@@ -63,12 +97,156 @@ class SpeakerDiarizer:
             return results
         except Exception as e:
             print(f"Diarization error: {e}")
+            print("  -> Falling back to lightweight CPU diarization.")
+            return self._diarize_lite(audio_path, speech_index)
+
+    def _diarize_lite(self, audio_path, speech_index=None, window=1.5, step=0.75):
+        """
+        Speed-first diarization without gated models or network:
+        energy VAD -> MFCC statistics over sliding windows -> agglomerative clustering.
+        Much cruder than pyannote (no overlap handling), but separates distinct voices.
+        """
+        print(f"Diarizing {audio_path} (lite)...")
+        try:
+            vad = VoiceActivityDetector()
+            y = vad.load_audio(audio_path)
+            regions = speech_index.regions() if speech_index else vad.detect(y)
+            if not regions:
+                return []
+
+            # MFCCs once for the whole track; windows are slices of the frame matrix
+            hop = 160
+            mfcc = librosa.feature.mfcc(y=y, sr=SAMPLE_RATE, n_mfcc=20, n_fft=512, hop_length=hop)[1:]
+            frames_per_sec = SAMPLE_RATE / hop
+
+            windows = [] # (start, end) in seconds
+            for start, end in regions:
+                if end - start <= window:
+                    windows.append((start, end))
+                    continue
+                for w_start in np.arange(start, end - window + step, step):
+                    windows.append((w_start, min(w_start + window, end)))
+
+            features = []
+            for start, end in windows:
+                block = mfcc[:, int(start * frames_per_sec):max(int(end * frames_per_sec), int(start * frames_per_sec) + 1)]
+                features.append(np.concatenate([block.mean(axis=1), block.std(axis=1)]))
+            features = np.nan_to_num(np.stack(features))
+
+            # Standardise across the recording so the shared channel/spectral shape cancels out
+            features = (features - features.mean(axis=0)) / (features.std(axis=0) + 1e-8)
+            features /= np.linalg.norm(features, axis=1, keepdims=True) + 1e-8
+
+            labels = _cluster_lite(features, Config.LITE_DIARIZATION_THRESHOLD, Config.LITE_NUM_SPEAKERS)
+
+            # Each window owns the span around its centre; merge consecutive equal labels into turns
+            names = {}
+            results = []
+            for (start, end), label, (reg_start, reg_end) in zip(windows, labels, _region_of_windows(windows, regions)):
+                centre = (start + end) / 2
+                own_start = reg_start if start <= reg_start else centre - step / 2
+                own_end = reg_end if end >= reg_end else centre + step / 2
+                if label not in names:
+                    names[label] = f"SPEAKER_{len(names):02d}"
+                speaker = names[label]
+                if results and results[-1]['speaker'] == speaker and own_start - results[-1]['end'] < 0.05:
+                    results[-1]['end'] = float(max(results[-1]['end'], own_end))
+                else:
+                    results.append({"start": float(own_start), "end": float(own_end), "speaker": speaker})
+
+            print(f"  Found {len(names)} speakers: {set(names.values())}")
+            return results
+        except Exception as e:
+            print(f"Lite diarization error: {e}")
             return []
 
+    def get_embedder(self):
+        """Shared speaker embedder (loaded once, also used by the voice bank)."""
+        if self.embedder is None:
+            self.embedder = SpeakerEmbedder(auth_token=self.auth_token)
+        return self.embedder
+
+    def _diarize_windowed(self, audio_path, duration, speech_index=None):
+        """
+        Diarizes overlapping windows one at a time (memory bounded by the window size),
+        then links the per-window speaker labels into global ones by clustering
+        speaker embeddings. Each window keeps the turns in its own half of the overlaps.
+        """
+        window = Config.DIARIZATION_WINDOW_SECONDS
+        overlap = Config.DIARIZATION_WINDOW_OVERLAP
+        step = window - overlap
+        window_starts = np.arange(0.0, max(duration - overlap, step), step)
+        print(f"  Long recording ({duration / 60:.1f} min): diarizing {len(window_starts)} windows of {window}s...")
+
+        embedder = self.get_embedder()
+        local_turns = [] # (start, end, local_speaker_index)
+        local_embeddings = []
+
+        for w, w_start in enumerate(window_starts):
+            w_end = min(w_start + window, duration)
+            # Only the window's own half of each overlap is kept; neighbours cover the rest
+            own_start = 0.0 if w == 0 else w_start + overlap / 2
+            own_end = duration if w == len(window_starts) - 1 else w_end - overlap / 2
+
+            if speech_index is not None and speech_index.speech_in(w_start, w_end) == 0:
+                print(f"    Window {w + 1}/{len(window_starts)}: no speech, skipped")
+                continue
+
+            clip, _ = librosa.load(audio_path, sr=SAMPLE_RATE, mono=True, offset=float(w_start), duration=float(w_end - w_start))
+            diarization = self.pipeline({"waveform": torch.from_numpy(clip)[None], "sample_rate": SAMPLE_RATE})
+
+            by_label = {}
+            for turn, _, speaker in diarization.itertracks(yield_label=True):
+                by_label.setdefault(speaker, []).append((turn.start, turn.end))
+
+            for speaker, turns in by_label.items():
+                # Embed up to 30s of this local speaker's speech from the window
+                pieces, total = [], 0
+                for start, end in sorted(turns, key=lambda t: t[1] - t[0], reverse=True):
+                    piece = clip[int(start * SAMPLE_RATE):int(end * SAMPLE_RATE)]
+                    pieces.append(piece)
+                    total += len(piece)
+                    if total >= 30 * SAMPLE_RATE:
+                        break
+                local_idx = len(local_embeddings)
+                local_embeddings.append(embedder.embed(np.concatenate(pieces)))
+
+                for start, end in turns:
+                    start, end = max(start + w_start, own_start), min(end + w_start, own_end)
+                    if end > start:
+                        local_turns.append((start, end, local_idx))
+
+            print(f"    Window {w + 1}/{len(window_starts)}: {len(by_label)} local speakers")
+            del clip, diarization
+
+        if not local_turns:
+            return []
+
+        threshold = Config.DIARIZATION_LINK_THRESHOLD or embedder.threshold
+        cluster_ids = _cluster_embeddings(np.stack(local_embeddings), threshold)
+
+        # Name global speakers in order of first appearance
+        names = {}
+        results = []
+        for start, end, local_idx in sorted(local_turns):
+            cluster = cluster_ids[local_idx]
+            if cluster not in names:
+                names[cluster] = f"SPEAKER_{len(names):02d}"
+            speaker = names[cluster]
+            if results and results[-1]['speaker'] == speaker and start - results[-1]['end'] < 0.01:
+                results[-1]['end'] = max(results[-1]['end'], end) # Stitch turns cut at a window boundary
+            else:
+                results.append({"start": start, "end": end, "speaker": speaker})
+
+        print(f"  Found {len(names)} speakers across windows: {set(names.values())}")
+        return results
+
     def assign_speakers_to_segments(self, transcription_segments, diarization_results):
         """
         Matches transcription segments (which have text) to the most likely speaker 
         from the diarization results based on time overlap.
+        Also stores 'speaker_overlap' (fraction of the segment covered by the chosen
+        speaker) and 'speaker_overlaps' (fraction per overlapping speaker).
         """
         if not diarization_results:
             # Fallback: Assign everyone to 'SPEAKER_00' if no diarization
@@ -77,36 +255,152 @@ class SpeakerDiarizer:
             return transcription_segments
 
         print("Assigning speakers to transcription segments...")
-        
-        for seg in transcription_segments:
-            seg_start = seg['start']
-            seg_end = seg['end']
-            seg_dur = seg_end - seg_start
-            
-            # Find all diarization turns that overlap with this segment
-            overlaps = []
-            for d_seg in diarization_results:
-                # Calculate overlap duration
-                overlap_start = max(seg_start, d_seg['start'])
-                overlap_end = min(seg_end, d_seg['end'])
-                overlap = max(0, overlap_end - overlap_start)
-                
-                if overlap > 0:
-                    overlaps.append((d_seg['speaker'], overlap))
-            
-            if not overlaps:
+        if not transcription_segments:
+            return transcription_segments
+
+        seg_starts = np.array([seg['start'] for seg in transcription_segments], dtype=np.float64)
+        seg_ends = np.array([seg['end'] for seg in transcription_segments], dtype=np.float64)
+        speakers, totals = _speaker_overlap_totals(seg_starts, seg_ends, diarization_results)
+
+        durations = np.maximum(seg_ends - seg_starts, 1e-9)
+        best = np.argmax(totals, axis=0)
+        best_totals = totals[best, np.arange(len(transcription_segments))]
+
+        for i, seg in enumerate(transcription_segments):
+            if best_totals[i] <= OVERLAP_EPSILON:
                 seg['speaker'] = "UNKNOWN"
-            else:
-                # Pick the speaker with the most overlap duration
-                # Sum overlap per speaker (in case of fragmented diarization)
-                speaker_totals = {}
-                for spk, duration in overlaps:
-                    speaker_totals[spk] = speaker_totals.get(spk, 0) + duration
-                
-                # Best speaker
-                best_speaker = max(speaker_totals, key=speaker_totals.get)
-                seg['speaker'] = best_speaker
-                
-            # print(f"  Segment ({seg_start:.1f}-{seg_end:.1f}) -> {seg['speaker']}")
-            
+                seg['speaker_overlap'] = 0.0
+                seg['speaker_overlaps'] = {}
+                continue
+            seg['speaker'] = speakers[best[i]]
+            seg['speaker_overlap'] = float(min(best_totals[i] / durations[i], 1.0))
+            seg['speaker_overlaps'] = {
+                speakers[k]: float(min(totals[k, i] / durations[i], 1.0))
+                for k in np.nonzero(totals[:, i] > OVERLAP_EPSILON)[0]
+            }
+
         return transcription_segments
+
+
+OVERLAP_EPSILON = 1e-9 # Ignore float noise from the prefix-sum subtraction
+
+
+def _region_of_windows(windows, regions):
+    """Yields the VAD region containing each window (both lists are sorted)."""
+    r = 0
+    for start, _ in windows:
+        while r < len(regions) - 1 and start >= regions[r][1]:
+            r += 1
+        yield regions[r]
+
+
+def _cluster_lite(features, threshold, num_speakers=None, max_points=2000):
+    """
+    Clusters window features; above max_points, clusters an even subsample and
+    assigns every window to the nearest cluster centroid (keeps linkage memory bounded).
+    Clusters covering fewer than 3 windows are folded into their nearest large cluster.
+    """
+    sample_idx = np.linspace(0, len(features) - 1, min(len(features), max_points)).astype(int)
+    sample = features[sample_idx]
+    if len(sample) < 2:
+        return np.zeros(len(features), dtype=int)
+
+    tree = linkage(sample, method="average", metric="cosine")
+    if num_speakers:
+        sample_labels = fcluster(tree, t=num_speakers, criterion="maxclust")
+    else:
+        sample_labels = fcluster(tree, t=1.0 - threshold, criterion="distance")
+
+    ids, counts = np.unique(sample_labels, return_counts=True)
+    keep = ids[counts >= 3] if np.any(counts >= 3) else ids
+    centroids = np.stack([sample[sample_labels == i].mean(axis=0) for i in keep])
+    centroids /= np.linalg.norm(centroids, axis=1, keepdims=True) + 1e-8
+    return np.argmax(features @ centroids.T, axis=1)
+
+
+def _cluster_embeddings(embeddings, threshold):
+    """
+    Agglomerative (average-linkage, cosine) clustering of L2-normalised embeddings.
+    Embeddings more similar than `threshold` end up in the same cluster.
+    Returns an array of cluster ids, one per embedding.
+    """
+    if len(embeddings) < 2:
+        return np.zeros(len(embeddings), dtype=int)
+    tree = linkage(embeddings, method="average", metric="cosine")
+    return fcluster(tree, t=1.0 - threshold, criterion="distance")
+
+
+def _speaker_overlap_totals(seg_starts, seg_ends, diarization_results):
+    """
+    Total overlap (seconds) between every segment and every speaker in O((N + M) log M).
+
+    For each speaker the covered time up to t is C(t) = sum(clip(t - start_j, 0, len_j))
+    over its turns, which sorted starts/ends and prefix sums give in one searchsorted
+    pass; the overlap of segment [a, b] is then C(b) - C(a). Fragmented turns of the
+    same speaker add up exactly as in a pairwise comparison.
+    Returns (speakers, totals) with totals shaped (num_speakers, num_segments).
+    """
+    turns_by_speaker = {}
+    for turn in diarization_results:
+        if turn['end'] > turn['start']:
+            turns_by_speaker.setdefault(turn['speaker'], []).append((turn['start'], turn['end']))
+
+    speakers = list(turns_by_speaker)
+    totals = np.zeros((max(len(speakers), 1), len(seg_starts)), dtype=np.float64)
+    for k, spk in enumerate(speakers):
+        turns = np.array(turns_by_speaker[spk], dtype=np.float64)
+        starts = np.sort(turns[:, 0])
+        ends = np.sort(turns[:, 1])
+        cum_starts = np.concatenate(([0.0], np.cumsum(starts)))
+        cum_ends = np.concatenate(([0.0], np.cumsum(ends)))
+
+        def covered(t):
+            n_started = np.searchsorted(starts, t, side='right')
+            n_ended = np.searchsorted(ends, t, side='right')
+            return (n_started * t - cum_starts[n_started]) - (n_ended * t - cum_ends[n_ended])
+
+        totals[k] = np.maximum(covered(seg_ends) - covered(seg_starts), 0.0)
+
+    return speakers, totals
+
+
+if __name__ == "__main__":
+    # Benchmark: vectorized assignment vs the previous pairwise O(N*M) loop on synthetic data
+    import time
+    import random
+
+    def assign_pairwise(segments, turns):
+        for seg in segments:
+            totals = {}
+            for d_seg in turns:
+                overlap = max(0, min(seg['end'], d_seg['end']) - max(seg['start'], d_seg['start']))
+                if overlap > 0:
+                    totals[d_seg['speaker']] = totals.get(d_seg['speaker'], 0) + overlap
+            seg['speaker'] = max(totals, key=totals.get) if totals else "UNKNOWN"
+        return segments
+
+    def synthetic(n, mean_len, labels):
+        t, items = 0.0, []
+        for _ in range(n):
+            length = random.uniform(0.3, 2 * mean_len)
+            items.append({'start': t, 'end': t + length, 'speaker': random.choice(labels)})
+            t += length + random.uniform(0.0, 0.5)
+        return items
+
+    random.seed(0)
+    n = 10_000
+    turns = synthetic(n, 3.0, [f"SPEAKER_{i:02d}" for i in range(6)])
+    segments = synthetic(n, 3.0, ["Speaker 0"])
+
+    diarizer = SpeakerDiarizer.__new__(SpeakerDiarizer)
+    t0 = time.perf_counter()
+    fast = diarizer.assign_speakers_to_segments([dict(s) for s in segments], turns)
+    t_fast = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    slow = assign_pairwise([dict(s) for s in segments], turns)
+    t_slow = time.perf_counter() - t0
+
+    mismatches = sum(a['speaker'] != b['speaker'] for a, b in zip(fast, slow))
+    print(f"{n} segments x {n} turns: vectorized {t_fast:.3f}s, pairwise {t_slow:.1f}s "
+          f"({t_slow / t_fast:.0f}x), mismatches: {mismatches}")
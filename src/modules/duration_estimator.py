@@ -0,0 +1,69 @@
+import re
+import numpy as np
+
+# Typical dubbed speaking rates: non-space characters per second of TTS output.
+# Syllabic/logographic scripts carry more per character, hence the lower rates.
+CHARS_PER_SECOND = {
+    'en': 12.5, 'es': 13.5, 'fr': 13.0, 'de': 12.5, 'it': 13.5, 'pt': 13.0, 'ru': 12.0,
+    'hi': 11.5, 'ur': 11.5, 'ar': 11.0, 'ja': 7.5, 'zh': 5.0, 'ko': 6.5
+}
+DEFAULT_CHARS_PER_SECOND = 12.5
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def spoken_length(text):
+    """Characters that take time to speak (whitespace excluded)."""
+    return len(_WHITESPACE.sub("", text))
+
+
+class DurationEstimator:
+    """
+    Predicts how long a line will take to synthesize, before any TTS runs.
+    Base rate per target language, scaled per speaker by how fast they talk in the
+    source (the clone keeps the reference's pace).
+    """
+
+    def __init__(self, language, chars_per_second=None):
+        self.language = language
+        self.chars_per_second = chars_per_second or CHARS_PER_SECOND.get(language, DEFAULT_CHARS_PER_SECOND)
+        self.speaker_factors = {}
+
+    def fit_speakers(self, segments, min_seconds=5.0):
+        """
+        Per-speaker pace factor: speaker's source chars/sec relative to the whole transcript.
+        Speakers with less than `min_seconds` of speech keep factor 1.0. Clamped to 0.75-1.33.
+        """
+        totals = {}
+        for seg in segments:
+            duration = seg.get('duration', seg['end'] - seg['start'])
+            chars, seconds = totals.get(seg.get('speaker'), (0, 0.0))
+            totals[seg.get('speaker')] = (chars + spoken_length(seg['text']), seconds + duration)
+
+        all_chars = sum(c for c, _ in totals.values())
+        all_seconds = sum(s for _, s in totals.values())
+        if not all_chars or not all_seconds:
+            return self.speaker_factors
+        overall = all_chars / all_seconds
+
+        self.speaker_factors = {
+            speaker: float(np.clip((chars / seconds) / overall, 0.75, 1.33))
+            for speaker, (chars, seconds) in totals.items()
+            if seconds >= min_seconds and chars
+        }
+        return self.speaker_factors
+
+    def rate(self, speaker=None):
+        return self.chars_per_second * self.speaker_factors.get(speaker, 1.0)
+
+    def estimate(self, text, speaker=None):
+        """Predicted synthesized duration in seconds."""
+        return spoken_length(text) / self.rate(speaker)
+
+    def overflow(self, text, slot, speaker=None):
+        """Predicted duration / available slot (> 1.0 means the line will have to be sped up)."""
+        return self.estimate(text, speaker) / slot if slot > 0 else 0.0
+
+    def max_chars(self, slot, speaker=None):
+        """Character budget (whitespace excluded) that fits the slot at natural pace."""
+        return max(1, int(slot * self.rate(speaker)))
@@ -2,14 +2,59 @@ import torch
 import librosa
 import numpy as np
 import os
-from transformers import pipeline
+import time
+from transformers import pipeline, AutoFeatureExtractor
+from src.config import Config
+
+SAMPLE_RATE = 16000 # wav2vec2 native rate
+
+NEUTRAL_STATS = {
+    "emotion": "neutral",
+    "confidence": 0.0,
+    "energy": "low",
+    "pitch": "mid",
+    "avg_pitch_hz": 0.0,
+    "avg_energy_val": 0.0
+}
 
 class EmotionAnalyzer:
-    def __init__(self, model_name="ehcalabres/wav2vec2-lg-xlsr-en-speech-emotion-recognition"):
-        print(f"Loading Emotion model '{model_name}'...")
+    def __init__(self, model_name="ehcalabres/wav2vec2-lg-xlsr-en-speech-emotion-recognition", batch_size=None, runtime=None):
+        self.runtime = runtime or Config.EMOTION_RUNTIME
+        self.batch_size = batch_size or Config.EMOTION_BATCH_SIZE
+        print(f"Loading Emotion model '{model_name}' ({self.runtime})...")
+
+        if self.runtime == "onnx":
+            try:
+                self.classifier = self._load_onnx_pipeline(model_name)
+                return
+            except Exception as e:
+                print(f"[WARNING] ONNX export/runtime unavailable ({e}). Falling back to int8 PyTorch.")
+                self.runtime = "int8"
+
         # Using the pipeline for audio classification
         self.classifier = pipeline("audio-classification", model=model_name)
 
+        if self.runtime == "int8":
+            # Dynamic int8 quantization of the Linear layers (the bulk of the XLSR transformer)
+            # Weights are quantized once at load; activations are quantized on the fly. CPU only.
+            self.classifier.model = torch.quantization.quantize_dynamic(
+                self.classifier.model, {torch.nn.Linear}, dtype=torch.qint8
+            )
+
+    def _load_onnx_pipeline(self, model_name):
+        """Exports the model to ONNX once (cached under CACHE_DIR) and runs it with onnxruntime."""
+        from optimum.onnxruntime import ORTModelForAudioClassification
+
+        export_dir = os.path.join(Config.CACHE_DIR, "onnx", model_name.replace("/", "__"))
+        if os.path.exists(os.path.join(export_dir, "config.json")):
+            model = ORTModelForAudioClassification.from_pretrained(export_dir)
+        else:
+            print("  Exporting emotion model to ONNX (one-time)...")
+            model = ORTModelForAudioClassification.from_pretrained(model_name, export=True)
+            model.save_pretrained(export_dir)
+        feature_extractor = AutoFeatureExtractor.from_pretrained(model_name)
+        return pipeline("audio-classification", model=model, feature_extractor=feature_extractor)
+
     def analyze_emotion(self, audio_path):
         """
         Detects primary emotion from audio segment.
@@ -26,27 +71,66 @@ class EmotionAnalyzer:
             print(f"Emotion analysis failed for {audio_path}: {e}")
             return "neutral", 0.0
 
+    def analyze_emotion_batch(self, waveforms, sr=SAMPLE_RATE):
+        """
+        Classifies many in-memory 16kHz waveforms at once.
+        Clips are sorted by length so each batch pads to similar sizes.
+        Returns a list of (label, score) in input order.
+        """
+        model = self.classifier.model
+        feature_extractor = self.classifier.feature_extractor
+        results = [("neutral", 0.0)] * len(waveforms)
+
+        # Shortest first: padding within a batch stays small
+        order = [i for i in np.argsort([len(w) for w in waveforms], kind="stable") if len(waveforms[i]) > 0]
+        for b in range(0, len(order), self.batch_size):
+            idx = order[b:b + self.batch_size]
+            try:
+                inputs = feature_extractor(
+                    [np.asarray(waveforms[i], dtype=np.float32) for i in idx],
+                    sampling_rate=sr,
+                    padding=True,
+                    return_tensors="pt"
+                )
+                with torch.inference_mode():
+                    logits = model(**inputs.to(model.device)).logits
+                probs = torch.softmax(logits, dim=-1).cpu()
+                scores, labels = probs.max(dim=-1)
+                for i, label, score in zip(idx, labels.tolist(), scores.tolist()):
+                    results[i] = (model.config.id2label[label], score)
+            except Exception as e:
+                print(f"Batched emotion analysis failed for {len(idx)} segments: {e}")
+
+        return results
+
     def analyze_prosody(self, audio_path):
         """
         Extracts pitch, energy, speaking rate.
         Note: Speaking rate needs text length, so this returns raw audio features.
         """
         y, sr = librosa.load(audio_path, sr=None)
-        
+        return self.analyze_prosody_array(y, sr)
+
+    def analyze_prosody_array(self, y, sr):
+        """Same as analyze_prosody() for an in-memory waveform."""
         # Energy (RMS)
         rms = librosa.feature.rms(y=y)[0]
         avg_energy = np.mean(rms)
-        energy_level = "medium"
-        if avg_energy < 0.01: energy_level = "low"
-        elif avg_energy > 0.05: energy_level = "high"
-        
+
         # Pitch (F0)
         # Using pyin for robustness on speech
-        f0, voiced_flag, voiced_probs = librosa.pyin(y, fmin=librosa.note_to_hz('C2'), fmax=librosa.note_to_hz('C7'))
+        f0, voiced_flag, voiced_probs = librosa.pyin(y, fmin=librosa.note_to_hz('C2'), fmax=librosa.note_to_hz('C7'), sr=sr)
         valid_f0 = f0[~np.isnan(f0)]
         avg_pitch = np.mean(valid_f0) if len(valid_f0) > 0 else 0
-        
-        pitch_tendency = "mid" 
+
+        return self._label_prosody(avg_energy, avg_pitch)
+
+    def _label_prosody(self, avg_energy, avg_pitch):
+        energy_level = "medium"
+        if avg_energy < 0.01: energy_level = "low"
+        elif avg_energy > 0.05: energy_level = "high"
+
+        pitch_tendency = "mid"
         # Simple heuristic thresholds (can be improved with gender detection)
         if avg_pitch < 150: pitch_tendency = "low"
         elif avg_pitch > 250: pitch_tendency = "high"
@@ -58,18 +142,122 @@ class EmotionAnalyzer:
             "avg_energy_val": float(avg_energy)
         }
 
-    def analyze_segment(self, audio_path):
+    def prosody_track(self, y, sr, hop_length=256, block_frames=2048):
+        """
+        Fast path: frame-wise RMS and YIN pitch over the whole track (vectorized per block of frames).
+        YIN has no voicing decision, so frames well below the track's speech level count as unvoiced.
+        Returns (rms, f0, voiced) frame arrays; slice them with prosody_for_range().
+        """
+        frame_length = 1024
+        pad = frame_length // 2
+        # Same frames as center=True (zero padding), but computed in blocks: yin's internal
+        # (frame_length x n_frames) complex buffers would take GBs for an hour-long track at once
+        n_frames = 1 + (len(y) + 2 * pad - frame_length) // hop_length if len(y) else 0
+        rms_blocks, f0_blocks = [], []
+        for a in range(0, n_frames, block_frames):
+            b = min(a + block_frames, n_frames)
+            lo, hi = a * hop_length - pad, (b - 1) * hop_length + frame_length - pad
+            clip = y[max(lo, 0):min(hi, len(y))]
+            clip = np.pad(clip, (max(0, -lo), max(0, hi - len(y))))
+            rms_blocks.append(librosa.feature.rms(y=clip, frame_length=frame_length, hop_length=hop_length, center=False)[0])
+            f0_blocks.append(librosa.yin(clip, fmin=librosa.note_to_hz('C2'), fmax=librosa.note_to_hz('C7'), sr=sr, frame_length=frame_length, hop_length=hop_length, center=False))
+        rms = np.concatenate(rms_blocks) if rms_blocks else np.zeros(0)
+        f0 = np.concatenate(f0_blocks) if f0_blocks else np.zeros(0)
+        n = min(len(rms), len(f0))
+        rms, f0 = rms[:n], f0[:n]
+        loud = np.percentile(rms, 95) if n else 0.0
+        voiced = rms > max(0.1 * loud, 1e-4)
+        return rms, f0, voiced
+
+    def prosody_for_range(self, track, start, end, sr, hop_length=256):
+        """Prosody fields (same as analyze_prosody) for [start, end] seconds of a prosody_track()."""
+        rms, f0, voiced = track
+        lo = int(start * sr / hop_length)
+        hi = max(int(end * sr / hop_length), lo + 1)
+        seg_rms = rms[lo:hi]
+        seg_f0 = f0[lo:hi][voiced[lo:hi]]
+        avg_energy = np.mean(seg_rms) if len(seg_rms) else 0.0
+        avg_pitch = np.mean(seg_f0) if len(seg_f0) else 0
+        return self._label_prosody(avg_energy, avg_pitch)
+
+    def analyze_segment(self, audio_path, speech_fraction=None):
+        """
+        speech_fraction: share of the segment that is speech (from the job's speech index).
+        (Near-)silent segments skip both models and get neutral defaults.
+        """
+        if speech_fraction is not None and speech_fraction < 0.1:
+            return dict(NEUTRAL_STATS)
+
         emotion, conf = self.analyze_emotion(audio_path)
         prosody = self.analyze_prosody(audio_path)
-        
+
         return {
             "emotion": emotion,
             "confidence": conf,
             **prosody
         }
 
+    def analyze_segments(self, audio_path, segments, speech_fractions=None):
+        """
+        Analyzes all segments of one track: the audio is decoded once, sliced in memory
+        and classified in batches. Returns one stats dict per segment (same order).
+        """
+        y, _ = librosa.load(audio_path, sr=SAMPLE_RATE, mono=True)
+
+        clips = []
+        active = []
+        for i, seg in enumerate(segments):
+            if speech_fractions is not None and speech_fractions[i] is not None and speech_fractions[i] < 0.1:
+                continue # (Near-)silent: neutral defaults
+            clip = y[int(seg['start'] * SAMPLE_RATE):int(seg['end'] * SAMPLE_RATE)]
+            if len(clip) == 0:
+                continue
+            clips.append(clip)
+            active.append(i)
+
+        emotions = self.analyze_emotion_batch(clips)
+
+        # 'fast': one vectorized YIN/RMS pass over the track, sliced per segment
+        # 'accurate': per-segment pyin (much slower, finer voicing decisions)
+        track = self.prosody_track(y, SAMPLE_RATE) if Config.PROSODY_MODE == "fast" else None
+
+        stats = [dict(NEUTRAL_STATS) for _ in segments]
+        for i, clip, (emotion, conf) in zip(active, clips, emotions):
+            if track is not None:
+                prosody = self.prosody_for_range(track, segments[i]['start'], segments[i]['end'], SAMPLE_RATE)
+            else:
+                prosody = self.analyze_prosody_array(clip, SAMPLE_RATE)
+            stats[i] = {"emotion": emotion, "confidence": conf, **prosody}
+        return stats
+
+def compare_runtimes(audio_paths, runtimes=("int8", "onnx")):
+    """
+    Accuracy/latency check of the optimized runtimes against the fp32 model on a set of clips.
+    Returns {runtime: {'agreement': share of identical top labels, 'max_score_diff': float, 'seconds': float}}.
+    """
+    clips = [librosa.load(path, sr=SAMPLE_RATE, mono=True)[0] for path in audio_paths]
+
+    def run(analyzer):
+        start = time.perf_counter()
+        results = analyzer.analyze_emotion_batch(clips)
+        return results, time.perf_counter() - start
+
+    reference, ref_seconds = run(EmotionAnalyzer(runtime="fp32"))
+    report = {"fp32": {"agreement": 1.0, "max_score_diff": 0.0, "seconds": ref_seconds}}
+    for runtime in runtimes:
+        analyzer = EmotionAnalyzer(runtime=runtime)
+        if analyzer.runtime != runtime:
+            continue # Fell back; nothing new to compare
+        results, seconds = run(analyzer)
+        agreement = np.mean([a[0] == b[0] for a, b in zip(results, reference)]) if clips else 1.0
+        max_diff = max((abs(a[1] - b[1]) for a, b in zip(results, reference) if a[0] == b[0]), default=0.0)
+        report[runtime] = {"agreement": float(agreement), "max_score_diff": float(max_diff), "seconds": seconds}
+    return report
+
 if __name__ == "__main__":
-    # Test
-    # ea = EmotionAnalyzer()
-    # print(ea.analyze_segment("temp/test_segment.wav"))
-    pass
+    # Accuracy check of int8/ONNX against fp32:
+    #   python -m src.modules.emotion_analyzer clip1.wav clip2.wav ...
+    import sys
+    if len(sys.argv) > 1:
+        for runtime, stats in compare_runtimes(sys.argv[1:]).items():
+            print(f"{runtime:>5}: agreement {stats['agreement']:.0%}, max score diff {stats['max_score_diff']:.3f}, {stats['seconds']:.2f}s")
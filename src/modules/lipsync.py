@@ -51,9 +51,11 @@ class LipSyncer:
                     for chunk in response.iter_content(chunk_size=8192):
                         f.write(chunk)
 
-    def sync_lips(self, video_path, audio_path, output_path):
+    def sync_lips(self, video_path, audio_path, output_path, speech_regions_path=None):
         """
         Runs Wav2Lip inference.
+        speech_regions_path: saved speech index covering the dubbed audio; frames outside
+        speech are passed through without face detection or model inference.
         """
         print(f"Starting Lip Sync: {video_path} + {audio_path}...")
         
@@ -69,6 +71,8 @@ class LipSyncer:
             "--resize_factor", "1", # 1 = 720p/1080p usually, higher numbers downscale more
             "--nosmooth" # Often cleaner results for dubbing
         ]
+        if speech_regions_path and os.path.exists(speech_regions_path):
+            cmd.extend(["--speech_regions", speech_regions_path])
         
         try:
             # We must run this inside the Wav2Lip directory context usually? 
@@ -0,0 +1,73 @@
+import os
+import numpy as np
+import librosa
+from src.config import Config
+
+SAMPLE_RATE = 16000
+
+
+class SpeakerEmbedder:
+    """
+    Fixed-size voice fingerprints for matching speakers.
+    'pyannote': neural embedding (gated model, needs HF_TOKEN).
+    'mfcc': MFCC statistics, no model download; weaker but runs anywhere.
+    """
+
+    # Cosine similarity above which two embeddings are treated as the same voice
+    DEFAULT_THRESHOLDS = {"pyannote": 0.70, "mfcc": 0.95}
+
+    def __init__(self, backend=None, auth_token=None):
+        self.auth_token = auth_token or os.environ.get("HF_TOKEN")
+        self.backend = backend or Config.SPEAKER_EMBEDDING_BACKEND
+        self.inference = None
+
+        if self.backend == "auto":
+            self.backend = "pyannote" if self.auth_token else "mfcc"
+
+        if self.backend == "pyannote":
+            try:
+                import torch
+                from pyannote.audio import Model, Inference
+                model = Model.from_pretrained("pyannote/embedding", use_auth_token=self.auth_token)
+                self.inference = Inference(model, window="whole")
+                self.inference.to(torch.device("cuda" if torch.cuda.is_available() else "cpu"))
+            except Exception as e:
+                print(f"[WARNING] Could not load pyannote embedding model ({e}). Using MFCC speaker embeddings.")
+                self.backend = "mfcc"
+
+        self.threshold = self.DEFAULT_THRESHOLDS[self.backend]
+
+    def embed(self, y, sr=SAMPLE_RATE):
+        """Returns an L2-normalised embedding for a mono waveform."""
+        if self.backend == "pyannote":
+            import torch
+            waveform = torch.from_numpy(np.asarray(y, dtype=np.float32))[None]
+            emb = np.asarray(self.inference({"waveform": waveform, "sample_rate": sr}), dtype=np.float32).reshape(-1)
+        else:
+            emb = self._mfcc_embedding(y, sr)
+        norm = np.linalg.norm(emb)
+        return emb / norm if norm > 0 else emb
+
+    def embed_files(self, paths, max_seconds=30.0):
+        """Embeds the concatenation of several clips (capped at max_seconds)."""
+        clips = []
+        total = 0
+        for path in paths:
+            y, _ = librosa.load(path, sr=SAMPLE_RATE, mono=True)
+            clips.append(y)
+            total += len(y)
+            if total >= max_seconds * SAMPLE_RATE:
+                break
+        y = np.concatenate(clips)[:int(max_seconds * SAMPLE_RATE)]
+        return self.embed(y)
+
+    def _mfcc_embedding(self, y, sr):
+        # Spectral-envelope statistics: mean/std of MFCC 1-19 (c0 is loudness, not identity)
+        mfcc = librosa.feature.mfcc(y=np.asarray(y, dtype=np.float32), sr=sr, n_mfcc=20, n_fft=512, hop_length=160)[1:]
+        if mfcc.shape[1] == 0:
+            return np.zeros(2 * mfcc.shape[0], dtype=np.float32)
+        return np.concatenate([mfcc.mean(axis=1), mfcc.std(axis=1)]).astype(np.float32)
+
+    @staticmethod
+    def similarity(a, b):
+        return float(np.dot(a, b))
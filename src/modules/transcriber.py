@@ -1,38 +1,391 @@
-import whisper
 import torch
 import json
 import os
+import collections
+import importlib.util
+import concurrent.futures
+import multiprocessing
+from src.config import Config
+from src.cache import file_hash, make_key, cache_path
+from src.modules.vad import VoiceActivityDetector, SAMPLE_RATE
+
+TRANSCRIPT_FORMAT_VERSION = 1
+
+
+class WhisperBackend:
+    """Reference openai-whisper engine (fp32 on CPU)."""
+    name = "whisper"
+    module = "whisper"
+
+    def __init__(self, model_size, device, compute_type=None, num_threads=None):
+        import whisper
+        self.model = whisper.load_model(model_size, device=device)
+
+    def transcribe(self, audio, word_timestamps=False):
+        """
+        audio: file path or 16kHz mono float32 array.
+        Returns (segments, language) with segments as [{'start', 'end', 'text'}, ...]
+        plus a 'words' list of {'word', 'start', 'end'} when word_timestamps is set.
+        """
+        result = self.model.transcribe(audio, word_timestamps=word_timestamps)
+        segments = []
+        for seg in result["segments"]:
+            entry = {"start": seg["start"], "end": seg["end"], "text": seg["text"]}
+            if word_timestamps:
+                entry["words"] = [
+                    {"word": w["word"], "start": w["start"], "end": w["end"]}
+                    for w in seg.get("words", [])
+                ]
+            segments.append(entry)
+        return segments, result.get("language")
+
+
+class FasterWhisperBackend:
+    """CTranslate2 engine (faster-whisper) with quantized weights, ~3-4x faster than whisper on CPU at int8."""
+    name = "faster-whisper"
+    module = "faster_whisper"
+
+    def __init__(self, model_size, device, compute_type="int8", num_threads=None):
+        from faster_whisper import WhisperModel
+        # Plain int8 is CPU-only in CTranslate2; keep fp16 activations on GPU
+        if device == "cuda" and compute_type == "int8":
+            compute_type = "int8_float16"
+        self.model = WhisperModel(model_size, device=device, compute_type=compute_type, cpu_threads=num_threads or os.cpu_count() or 0)
+
+    def transcribe(self, audio, word_timestamps=False):
+        # faster-whisper returns a lazy generator; consuming it runs the decoding
+        seg_iter, info = self.model.transcribe(audio, beam_size=5, word_timestamps=word_timestamps)
+        segments = []
+        for seg in seg_iter:
+            entry = {"start": seg.start, "end": seg.end, "text": seg.text}
+            if word_timestamps:
+                entry["words"] = [
+                    {"word": w.word, "start": w.start, "end": w.end}
+                    for w in (seg.words or [])
+                ]
+            segments.append(entry)
+        return segments, info.language
+
+
+ASR_BACKENDS = {
+    WhisperBackend.name: WhisperBackend,
+    FasterWhisperBackend.name: FasterWhisperBackend,
+}
+
+
+def _map_segment_times(seg, fn):
+    """Applies a timestamp mapping to a segment and its words."""
+    mapped = {**seg, "start": fn(seg["start"]), "end": fn(seg["end"])}
+    if "words" in seg:
+        mapped["words"] = [{**w, "start": fn(w["start"]), "end": fn(w["end"])} for w in seg["words"]]
+    return mapped
+
+
+def _decode_regions(backend, vad, y, regions, word_timestamps=False):
+    """
+    Decodes only the given speech regions of `y` in a single batched pass.
+    Returns (segments, language) with timestamps relative to the start of `y`.
+    """
+    speech = sum(e - s for s, e in regions)
+    # Not worth remapping when there is next to nothing to skip
+    if speech > 0.95 * len(y) / SAMPLE_RATE:
+        return backend.transcribe(y, word_timestamps=word_timestamps)
+
+    compact_audio, offsets = vad.compact(y, regions)
+    raw_segments, language = backend.transcribe(compact_audio, word_timestamps=word_timestamps)
+
+    mapped = []
+    for seg in raw_segments:
+        seg = _map_segment_times(seg, lambda t: vad.map_time(t, offsets))
+        if seg["end"] <= seg["start"]:
+            continue # Decoded entirely inside an inserted gap
+        mapped.append(seg)
+    return mapped, language
+
+
+def _merge_chunk_segments(chunk_results):
+    """Concatenates per-chunk segments, dropping duplicates and overlaps at chunk boundaries."""
+    merged = []
+    for segments in chunk_results:
+        for seg in segments:
+            if merged and seg["start"] < merged[-1]["end"]:
+                prev = merged[-1]
+                if seg["text"].strip().lower() == prev["text"].strip().lower():
+                    continue
+                seg = {**seg, "start": prev["end"]}
+                if seg["end"] <= seg["start"]:
+                    continue
+            merged.append(seg)
+    return merged
+
+
+# Parallel transcription: each worker process loads its own model once
+_worker_backend = None
+_worker_vad = None
+
+def _init_asr_worker(backend_name, model_size, compute_type, num_threads):
+    global _worker_backend, _worker_vad
+    torch.set_num_threads(num_threads)
+    _worker_backend = ASR_BACKENDS[backend_name](model_size, "cpu", compute_type, num_threads=num_threads)
+    _worker_vad = VoiceActivityDetector()
+
+def _transcribe_chunk(y, regions, word_timestamps):
+    return _decode_regions(_worker_backend, _worker_vad, y, regions, word_timestamps)
+
 
 class Transcriber:
-    def __init__(self, model_size="base", device=None):
+    def __init__(self, model_size="base", device=None, backend=None, compute_type=None, num_workers=None):
         self.device = device if device else ("cuda" if torch.cuda.is_available() else "cpu")
-        print(f"Loading Whisper model '{model_size}' on {self.device}...")
-        self.model = whisper.load_model(model_size, device=self.device)
+        self.model_size = model_size
+        self.backend_name = backend or Config.ASR_BACKEND
+        self.compute_type = compute_type or Config.ASR_COMPUTE_TYPE
+        self.num_workers = num_workers if num_workers is not None else Config.ASR_WORKERS
+        self.word_timestamps = Config.WORD_TIMESTAMPS
+        self.detected_language = None
+
+        if self.backend_name not in ASR_BACKENDS:
+            print(f"[WARNING] Unknown ASR backend '{self.backend_name}'. Defaulting to 'whisper'.")
+            self.backend_name = WhisperBackend.name
+
+        # LAZY LOADING: cached or pre-made transcripts never need the ASR model
+        self.backend = None
+
+        if self.num_workers > 1 and self.device != "cpu":
+            # One model per process would multiply GPU memory; the GPU is fast enough on its own
+            print("[INFO] Parallel ASR workers are CPU-only. Transcribing sequentially on GPU.")
+            self.num_workers = 1
 
-    def transcribe(self, audio_path):
+        self.vad = VoiceActivityDetector() if Config.USE_VAD else None
+
+    def _get_backend(self):
+        if self.backend is None:
+            print(f"Loading ASR model '{self.model_size}' ({self.backend_name}) on {self.device}...")
+            try:
+                self.backend = ASR_BACKENDS[self.backend_name](self.model_size, self.device, self.compute_type)
+            except ImportError as e:
+                if self.backend_name == WhisperBackend.name:
+                    raise
+                print(f"[WARNING] ASR backend '{self.backend_name}' unavailable ({e}). Falling back to 'whisper'.")
+                self.backend_name = WhisperBackend.name
+                self.backend = WhisperBackend(self.model_size, self.device)
+        return self.backend
+
+    def _resolve_backend_name(self):
+        """Applies the same import fallback as _get_backend() without loading a model."""
+        if self.backend is None and importlib.util.find_spec(ASR_BACKENDS[self.backend_name].module) is None:
+            print(f"[WARNING] ASR backend '{self.backend_name}' unavailable. Falling back to 'whisper'.")
+            self.backend_name = WhisperBackend.name
+        return self.backend_name
+
+    @property
+    def model_id(self):
+        return f"{self.backend_name}:{self.model_size}"
+
+    def _cache_options(self):
+        """Everything that changes the decoded output; part of the transcript cache key."""
+        return {
+            "model": self.model_id,
+            "compute_type": self.compute_type if self.backend_name == FasterWhisperBackend.name else None,
+            "vad": [Config.VAD_TOP_DB, Config.VAD_MIN_SPEECH, Config.VAD_MIN_SILENCE, Config.VAD_PAD] if self.vad else None,
+            "word_timestamps": self.word_timestamps,
+            "max_segment_seconds": Config.MAX_SEGMENT_SECONDS if self.word_timestamps else None,
+            "clean_vocals": Config.CLEAN_VOCALS_FOR_ASR
+        }
+
+    def transcribe(self, audio_path, cache_source=None, speech_index=None):
         """
         Transcribes the audio file.
         Returns a list of segments with start, end, text, and basic speaker placeholder.
+        Results are cached by audio content hash and decoding options. Pass `cache_source`
+        to hash another file instead (e.g. the pre-separation audio, since Demucs output
+        is not bit-identical across runs). A shared `speech_index` replaces the internal VAD pass.
         """
+        cache_file = None
+        if Config.USE_TRANSCRIPT_CACHE:
+            # Derived audio (e.g. separated vocals) never shares a key with its source transcribed directly,
+            # and depends on the separation model that produced it
+            options = self._cache_options()
+            if cache_source:
+                options["demucs_model"] = Config.DEMUCS_MODEL
+            key = make_key(file_hash(cache_source or audio_path), cache_source is not None, options)
+            cache_file = cache_path("transcripts", key, ".json")
+            if os.path.exists(cache_file):
+                print(f"Using cached transcript for {audio_path}")
+                return self.load_transcription(cache_file)
+
         print(f"Transcribing {audio_path}...")
-        result = self.model.transcribe(audio_path)
-        
+        if self.vad or self.num_workers > 1 or speech_index:
+            raw_segments, language = self._transcribe_regions(audio_path, speech_index)
+        else:
+            raw_segments, language = self._get_backend().transcribe(audio_path, word_timestamps=self.word_timestamps)
+        self.detected_language = language
+
         segments = []
-        for segment in result["segments"]:
-            segments.append({
+        for segment in raw_segments:
+            entry = {
                 "speaker": "Speaker 0", # Whisper standard doesn't do diarization without extra tools
                 "start": segment["start"],
                 "end": segment["end"],
                 "text": segment["text"].strip()
-            })
-            
+            }
+            if segment.get("words"):
+                entry["words"] = segment["words"]
+                for part in self._split_long_segment(self._trim_to_words(entry)):
+                    segments.append(part)
+            else:
+                segments.append(entry)
+
+        if cache_file:
+            self.save_transcription(segments, cache_file)
         return segments
 
+    def _trim_to_words(self, seg):
+        """Tightens segment boundaries to the first/last spoken word (drops trailing silence)."""
+        words = seg["words"]
+        start = max(seg["start"], words[0]["start"])
+        end = min(seg["end"], words[-1]["end"])
+        if end > start:
+            seg["start"], seg["end"] = start, end
+        return seg
+
+    def _split_long_segment(self, seg):
+        """
+        Splits segments longer than MAX_SEGMENT_SECONDS at a word boundary,
+        preferring sentence punctuation, then the longest pause near the middle.
+        """
+        words = seg["words"]
+        if seg["end"] - seg["start"] <= Config.MAX_SEGMENT_SECONDS or len(words) < 2:
+            return [seg]
+
+        midpoint = (seg["start"] + seg["end"]) / 2
+        best_idx, best_score = None, None
+        for i in range(len(words) - 1):
+            pause = words[i + 1]["start"] - words[i]["end"]
+            punctuated = words[i]["word"].strip()[-1:] in ".?!,;:"
+            # Favour punctuation and long pauses, penalise cuts far from the middle
+            score = pause + (0.5 if punctuated else 0.0) - 0.05 * abs(words[i]["end"] - midpoint)
+            if best_score is None or score > best_score:
+                best_idx, best_score = i, score
+
+        parts = []
+        for chunk in (words[:best_idx + 1], words[best_idx + 1:]):
+            part = {
+                **seg,
+                "start": chunk[0]["start"],
+                "end": chunk[-1]["end"],
+                "text": "".join(w["word"] for w in chunk).strip(),
+                "words": chunk
+            }
+            parts.extend(self._split_long_segment(part))
+        return parts
+
+    def _transcribe_regions(self, audio_path, speech_index=None):
+        """
+        Runs VAD once (or reuses the job's speech index), then decodes the speech regions
+        either in a single batched pass or split at silences into chunks spread over a
+        pool of worker processes. Timestamps are mapped back to the original timeline.
+        """
+        vad = self.vad or VoiceActivityDetector()
+        gated = self.vad is not None or speech_index is not None
+        y = vad.load_audio(audio_path)
+        regions = speech_index.regions() if speech_index else vad.detect(y)
+        total = len(y) / SAMPLE_RATE
+        speech = sum(e - s for s, e in regions)
+        print(f"  VAD: {len(regions)} speech regions, {speech:.1f}s of {total:.1f}s audio")
+
+        if not regions:
+            return ([], None) if gated else self._get_backend().transcribe(y, word_timestamps=self.word_timestamps)
+
+        chunks = self._split_chunks(regions, total, gated)
+        if self.num_workers > 1 and len(chunks) > 1:
+            return self._transcribe_parallel(y, chunks)
+
+        if not gated:
+            return self._get_backend().transcribe(y, word_timestamps=self.word_timestamps)
+        return _decode_regions(self._get_backend(), vad, y, regions, self.word_timestamps)
+
+    def _split_chunks(self, regions, total, gated=True):
+        """Groups consecutive speech regions into chunks of at most ASR_CHUNK_SECONDS, cut at silences."""
+        chunks = [[regions[0]]]
+        for region in regions[1:]:
+            if region[1] - chunks[-1][0][0] > Config.ASR_CHUNK_SECONDS:
+                chunks.append([region])
+            else:
+                chunks[-1].append(region)
+
+        if not gated:
+            # Without VAD gating every chunk covers its full span, split in the middle of each pause
+            bounds = [0.0] + [(prev[-1][1] + nxt[0][0]) / 2 for prev, nxt in zip(chunks, chunks[1:])] + [total]
+            chunks = [[(bounds[i], bounds[i + 1])] for i in range(len(chunks))]
+        return chunks
+
+    def _transcribe_parallel(self, y, chunks):
+        # Resolve the backend (and any import fallback) before spawning workers, but leave the
+        # model itself to the workers: the parent only loads one if a chunk has to be retried locally
+        self._resolve_backend_name()
+        workers = min(self.num_workers, len(chunks))
+        threads = max(1, (os.cpu_count() or 1) // workers)
+        print(f"  Transcribing {len(chunks)} chunks on {workers} worker processes ({threads} threads each)...")
+
+        results = []
+        languages = []
+        ctx = multiprocessing.get_context("spawn")
+        with concurrent.futures.ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=ctx,
+            initializer=_init_asr_worker,
+            initargs=(self.backend_name, self.model_size, self.compute_type, threads)
+        ) as pool:
+            futures = []
+            for chunk in chunks:
+                chunk_start, chunk_end = chunk[0][0], chunk[-1][1]
+                clip = y[int(chunk_start * SAMPLE_RATE):int(chunk_end * SAMPLE_RATE)]
+                local_regions = [(s - chunk_start, e - chunk_start) for s, e in chunk]
+                futures.append((chunk_start, clip, local_regions, pool.submit(_transcribe_chunk, clip, local_regions, self.word_timestamps)))
+
+            for chunk_start, clip, local_regions, future in futures:
+                try:
+                    segments, language = future.result()
+                except Exception as e:
+                    print(f"[WARNING] ASR worker failed on chunk at {chunk_start:.1f}s: {e}. Retrying locally.")
+                    segments, language = _decode_regions(self._get_backend(), self.vad or VoiceActivityDetector(), clip, local_regions, self.word_timestamps)
+                results.append([_map_segment_times(seg, lambda t: t + chunk_start) for seg in segments])
+                languages.append(language)
+
+        detected = [lang for lang in languages if lang]
+        language = collections.Counter(detected).most_common(1)[0][0] if detected else None
+        return _merge_chunk_segments(results), language
+
     def save_transcription(self, segments, output_path):
+        """Saves segments together with the detected language and model id, loadable via load_transcription()."""
+        payload = {
+            "version": TRANSCRIPT_FORMAT_VERSION,
+            "model": self.model_id,
+            "language": self.detected_language,
+            "options": self._cache_options(),
+            "segments": segments
+        }
         with open(output_path, 'w', encoding='utf-8') as f:
-            json.dump(segments, f, indent=2)
+            json.dump(payload, f, indent=2, ensure_ascii=False)
         print(f"Transcription saved to {output_path}")
 
+    def load_transcription(self, input_path):
+        """
+        Loads a transcript written by save_transcription() (or a plain list of segments).
+        Restores detected_language; returns the segments.
+        """
+        with open(input_path, 'r', encoding='utf-8') as f:
+            payload = json.load(f)
+
+        if isinstance(payload, list):
+            # Legacy format: bare segment list
+            self.detected_language = None
+            return payload
+
+        self.detected_language = payload.get("language")
+        print(f"Loaded transcript: {len(payload['segments'])} segments ({payload.get('model')}, language={self.detected_language})")
+        return payload["segments"]
+
 if __name__ == "__main__":
     # Test stub
     # tx = Transcriber()
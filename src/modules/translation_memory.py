@@ -0,0 +1,73 @@
+import os
+import re
+import time
+import sqlite3
+import threading
+import unicodedata
+from src.config import Config
+
+
+class TranslationMemory:
+    """
+    Persistent SQLite store of past translations, keyed by normalized source text,
+    target language, service and model. Consulted before any network call so recurring
+    lines (intros, catchphrases, re-runs of the same video) translate instantly.
+    """
+
+    def __init__(self, db_path=None):
+        self.db_path = db_path or Config.TRANSLATION_MEMORY_PATH
+        os.makedirs(os.path.dirname(self.db_path) or ".", exist_ok=True)
+        # One connection shared by the translation worker threads (writes are serialized by the lock)
+        self.conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        self.lock = threading.Lock()
+        with self.lock, self.conn:
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS translations ("
+                " source TEXT NOT NULL,"
+                " target_language TEXT NOT NULL,"
+                " service TEXT NOT NULL,"
+                " model TEXT NOT NULL,"
+                " translation TEXT NOT NULL,"
+                " updated REAL NOT NULL,"
+                " PRIMARY KEY (source, target_language, service, model))"
+            )
+
+    @staticmethod
+    def normalize(text):
+        """Unicode-normalized, whitespace-collapsed source text (case and punctuation are kept: they change the translation)."""
+        return re.sub(r"\s+", " ", unicodedata.normalize("NFC", text)).strip()
+
+    def lookup_many(self, texts, target_language, service, model=None):
+        """Returns {text: translation} for the texts already in memory."""
+        keys = {self.normalize(text): text for text in texts}
+        found = {}
+        names = list(keys)
+        with self.lock:
+            # Stay well under SQLite's bound-parameter limit
+            for b in range(0, len(names), 500):
+                batch = names[b:b + 500]
+                rows = self.conn.execute(
+                    f"SELECT source, translation FROM translations"
+                    f" WHERE target_language = ? AND service = ? AND model = ? AND source IN ({','.join('?' * len(batch))})",
+                    [target_language, service, model or "", *batch]
+                ).fetchall()
+                for source, translation in rows:
+                    found[keys[source]] = translation
+        return found
+
+    def store_many(self, pairs, target_language, service, model=None):
+        """Saves (source_text, translation) pairs, replacing older entries."""
+        now = time.time()
+        rows = [
+            (self.normalize(source), target_language, service, model or "", translation, now)
+            for source, translation in pairs
+            if source.strip() and translation and translation.strip()
+        ]
+        if not rows:
+            return
+        with self.lock, self.conn:
+            self.conn.executemany("INSERT OR REPLACE INTO translations VALUES (?, ?, ?, ?, ?, ?)", rows)
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
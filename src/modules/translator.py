@@ -1,9 +1,13 @@
 import os
 import json
 import time
+import threading
+import concurrent.futures
 from openai import OpenAI, RateLimitError, APIConnectionError, AuthenticationError
 from deep_translator import GoogleTranslator
 from src.config import Config
+from src.modules.translation_memory import TranslationMemory
+from src.modules.duration_estimator import DurationEstimator
 
 class Translator:
     def __init__(self, target_language="en", service_override=None):
@@ -13,11 +17,22 @@ class Translator:
         self.service = service_override if service_override else Config.TRANSLATION_SERVICE
         self.client = None
         self.model = None
+        self.rate_limiter = RateLimiter(Config.TRANSLATION_RPM)
+        # Set on an authentication failure: queued chunks go straight to the fallback
+        self.llm_disabled = threading.Event()
+        self.estimator = DurationEstimator(self.target_language) if Config.DURATION_AWARE_TRANSLATION else None
+
+        self.memory = None
+        if Config.USE_TRANSLATION_MEMORY:
+            try:
+                self.memory = TranslationMemory()
+            except Exception as e:
+                print(f"[WARNING] Translation memory unavailable ({e}). Translating without it.")
 
         print(f"Initializing Translator Service: {self.service}")
 
-        # Initialize fallback translator (always available)
-        self.fallback_translator = GoogleTranslator(source='auto', target=self.target_language)
+        # Google fallback clients are created per thread on first use (see _google_call)
+        self._google_local = threading.local()
 
         if self.service == "google":
             print("Selected Google Translate (Non-LLM).")
@@ -44,90 +59,391 @@ class Translator:
             else:
                 self.client = OpenAI(base_url=base_url, api_key=self.api_key)
         
+        elif self.service == "mock":
+            # Local stand-in server (mock_llm_server.py) for offline load testing
+            self.api_key = "mock"
+            self.model = Config.MOCK_LLM_MODEL
+            self.client = OpenAI(base_url=Config.MOCK_LLM_BASE_URL, api_key=self.api_key)
+
         else:
              print(f"[WARNING] Unknown service '{self.service}'. Defaulting to Google Fallback.")
 
     def _use_fallback_translation(self, segments):
         print(f"⚠️ Switching to Google Translate fallback for {len(segments)} segments...")
+        remembered = self._recall(segments, "google")
+        todo = [(i, seg["text"]) for i, seg in enumerate(segments) if seg["text"] not in remembered]
+
+        # Lines are joined into few large requests, issued concurrently
+        translations = {}
+        batches = _batch_lines(todo, Config.GOOGLE_BATCH_CHARS)
+        if batches:
+            workers = max(1, min(Config.GOOGLE_MAX_WORKERS, len(batches)))
+            with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+                for batch_translations in executor.map(self._google_batch, batches):
+                    translations.update(batch_translations)
+
         translated_segments = []
-        for seg in segments:
+        for i, seg in enumerate(segments):
             new_seg = seg.copy()
+            if seg["text"] in remembered:
+                new_seg["text_translated"] = remembered[seg["text"]]
+            else:
+                new_seg["text_translated"] = translations.get(i) or seg["text"] # Ultimate fallback
+            translated_segments.append(new_seg)
+        self._remember([(segments[i]["text"], text) for i, text in translations.items() if text], "google")
+        return translated_segments
+
+    def _google_batch(self, batch):
+        """
+        Translates [(index, text), ...] in one request (lines joined by newlines).
+        If the reply does not split back into the same number of lines, the batch is
+        translated line by line instead. Returns {index: translation or None}.
+        """
+        lines = [" ".join(text.split()) for _, text in batch] # Line breaks inside a line would break the split
+        if len(batch) > 1:
             try:
-                # deep_translator is blocking, but fast enough for fallback
-                translated = self.fallback_translator.translate(seg["text"])
-                new_seg["text_translated"] = translated
+                parts = self._google_call("\n".join(lines)).split("\n")
+                if len(parts) == len(batch):
+                    return {i: part.strip() for (i, _), part in zip(batch, parts)}
+                print(f"[WARNING] Google batch split mismatch ({len(parts)} vs {len(batch)}). Translating lines individually.")
+            except Exception as e:
+                print(f"[ERROR] Google Translate batch failed: {e}. Translating lines individually.")
+
+        results = {}
+        for (i, _), line in zip(batch, lines):
+            try:
+                results[i] = self._google_call(line)
             except Exception as e:
                 print(f"[ERROR] Google Translate failed for segment: {e}")
-                new_seg["text_translated"] = seg["text"] # Ultimate fallback
-            translated_segments.append(new_seg)
-        return translated_segments
+                results[i] = None
+        return results
+
+    def _google_call(self, text):
+        """One GoogleTranslator request with retries/backoff. Each thread gets its own client (it is not thread-safe)."""
+        translator = getattr(self._google_local, "translator", None)
+        if translator is None:
+            translator = self._google_local.translator = GoogleTranslator(source='auto', target=self.target_language)
+
+        for attempt in range(Config.TRANSLATION_MAX_RETRIES + 1):
+            try:
+                return translator.translate(text)
+            except Exception:
+                if attempt == Config.TRANSLATION_MAX_RETRIES:
+                    raise
+                time.sleep(min(2 ** attempt, 30))
+
+    def _recall(self, segments, service, model=None):
+        """{source_text: translation} for segments already in the translation memory."""
+        if not self.memory:
+            return {}
+        try:
+            return self.memory.lookup_many([seg["text"] for seg in segments], self.target_language, service, model)
+        except Exception as e:
+            print(f"[WARNING] Translation memory lookup failed: {e}")
+            return {}
+
+    def _remember(self, pairs, service, model=None):
+        if not self.memory or not pairs:
+            return
+        try:
+            self.memory.store_many(pairs, self.target_language, service, model)
+        except Exception as e:
+            print(f"[WARNING] Translation memory write failed: {e}")
 
     def translate_segments(self, segments):
         """
         Translates a list of segments using an LLM for context awareness.
-        Falls back to Google Translate on error.
+        The transcript is split into token-budgeted chunks (each carrying a few preceding lines
+        as context) that are translated concurrently and stitched back by line ID.
+        Lines an LLM chunk could not deliver fall back to Google Translate.
+        """
+        translated_segments = [None] * len(segments)
+        for i, new_seg in self.translate_segments_stream(segments):
+            translated_segments[i] = new_seg
+        return translated_segments
+
+    def translate_segments_stream(self, segments):
+        """
+        Same as translate_segments(), but yields (index, translated_segment) as soon as each
+        line is available (memory hits first, with the LLM requests already in flight, then
+        chunk by chunk in completion order), so synthesis can start on early segments while
+        later chunks are still being translated.
+        Every index is yielded exactly once.
         """
         if not self.client:
             print("[INFO] No LLM API Key. Using Google Translate directly.")
-            return self._use_fallback_translation(segments)
+            yield from enumerate(self._use_fallback_translation(segments))
+            return
+
+        # Lines translated before (by this service/model) skip the network entirely
+        remembered = self._recall(segments, self.service, self.model)
+        todo = [i for i, seg in enumerate(segments) if seg["text"] not in remembered]
+        if remembered:
+            print(f"  Translation memory: {len(segments) - len(todo)}/{len(segments)} lines already known.")
+
+        if self.estimator:
+            self.estimator.fit_speakers(segments)
+
+        chunks = self._chunk_segments(segments, todo)
+        if chunks:
+            print(f"Translating {len(todo)} segments to {self.target_language} via LLM ({self.model}) in {len(chunks)} chunks...")
+
+        # Memory holds plain translations (not fitted to any slot): hits that would overrun
+        # this segment's slot go through the shortening pass alongside the chunks
+        hits = {i: remembered[seg["text"]] for i, seg in enumerate(segments) if seg["text"] in remembered}
+        refit = {i: text for i, text in hits.items() if self._overflows(segments[i], text)} if self.estimator else {}
+
+        # Requests go out before the memory hits are handed over, so they stay in flight
+        # while the consumer synthesizes the hits
+        completed = self._translate_chunks(segments, chunks, refit)
+
+        for i, text in hits.items():
+            if i not in refit:
+                yield i, dict(segments[i], text_translated=text)
+
+        for indices, translations, shortened in completed:
+            self._remember([(segments[i]["text"], text) for i, text in translations.items() if i not in hits], self.service, self.model)
+            for i in indices:
+                if i in translations:
+                    yield i, dict(segments[i], text_translated=shortened.get(i, translations[i]))
+
+            missing = [i for i in indices if i not in translations]
+            if missing:
+                print(f"[WARNING] LLM returned no translation for {len(missing)} lines.")
+                yield from zip(missing, self._use_fallback_translation([segments[i] for i in missing]))
+
+    def _chunk_segments(self, segments, indices=None):
+        """
+        Greedy split of `indices` (default: all segments) into chunks whose estimated prompt size
+        stays within TRANSLATION_CHUNK_TOKENS. Returns a list of (indices, context_indices):
+        context lines are shown to the model for continuity but not translated.
+        """
+        budget = Config.TRANSLATION_CHUNK_TOKENS
+        chunks = []
+        current, current_tokens = [], 0
+        for i in (range(len(segments)) if indices is None else indices):
+            tokens = _estimate_tokens(segments[i]["text"]) + LINE_OVERHEAD_TOKENS
+            if current and current_tokens + tokens > budget:
+                chunks.append(current)
+                current, current_tokens = [], 0
+            current.append(i)
+            current_tokens += tokens
+        if current:
+            chunks.append(current)
+
+        context_lines = Config.TRANSLATION_CONTEXT_LINES
+        return [(indices, list(range(max(0, indices[0] - context_lines), indices[0]))) for indices in chunks]
+
+    def _translate_chunks(self, segments, chunks, known=None):
+        """
+        Submits all chunk requests right away (run concurrently), plus one shortening pass
+        over `known` ({index: translation} already available) if given.
+        Returns an iterator of (indices, translations, shortened) in completion order
+        (see _translate_and_fit_chunk).
+        """
+        jobs = [(indices, context, None) for indices, context in chunks]
+        if known:
+            jobs.append((list(known), [], known))
+        workers = max(1, min(Config.TRANSLATION_MAX_WORKERS, len(jobs)))
+        executor = concurrent.futures.ThreadPoolExecutor(max_workers=workers)
+        futures = {
+            executor.submit(self._translate_and_fit_chunk, segments, indices, context, translations): indices
+            for indices, context, translations in jobs
+        }
+        executor.shutdown(wait=False) # Submitted requests still run; the threads exit when done
+        return ((futures[future], *future.result()) for future in concurrent.futures.as_completed(futures))
+
+    def _translate_and_fit_chunk(self, segments, indices, context, known=None):
+        """
+        Translates one chunk (or takes the `known` translations) and shortens the lines predicted
+        to overrun their slot. Returns ({index: translation}, {index: shorter translation}):
+        the plain translations are what the memory keeps, since a rewrite only fits this slot.
+        """
+        translations = known if known is not None else self._translate_chunk(segments, indices, context)
+        shortened = {}
+        if self.estimator and translations and not self.llm_disabled.is_set():
+            shortened = self._shorten_overflows(segments, translations)
+        return translations, shortened
+
+    def _overflows(self, seg, text):
+        """True if `text` is predicted to overrun the segment's slot by more than TRANSLATION_MAX_OVERFLOW."""
+        slot = seg.get('duration', seg['end'] - seg['start'])
+        return self.estimator.overflow(text, slot, seg.get('speaker')) > Config.TRANSLATION_MAX_OVERFLOW
+
+    def _shorten_overflows(self, segments, translations):
+        """
+        Asks the LLM once to rephrase only the lines predicted to overrun their slot
+        (cheaper than synthesizing and then squeezing them 2x).
+        Returns {index: shorter translation}; lines it could not shorten are left out.
+        """
+        over = {}
+        for i, text in translations.items():
+            seg = segments[i]
+            if self._overflows(seg, text):
+                over[i] = self.estimator.max_chars(seg.get('duration', seg['end'] - seg['start']), seg.get('speaker'))
+        if not over:
+            return {}
 
-        print(f"Translating {len(segments)} segments to {self.target_language} via LLM ({self.model})...")
-        
-        # Prepare the payload
-        # Minimal payload to save tokens/complexity
-        transcript_text = "\n".join([f"{i}: [Duration: {seg.get('duration', 0):.2f}s] {seg['text']}" for i, seg in enumerate(segments)])
-        
         system_prompt = (
-            f"You are a professional dubbing translator. Translate the following transcript lines to {self.target_language}. "
-            "CRITICAL: The translation must be concise to match the original speaking duration. "
-            "If the target language naturally takes longer, shorten the phrasing or omit filler words while keeping the core meaning. "
-            "The input format is 'Line ID: [Duration: Xs] Text'. "
-            "Return ONLY a JSON array of strings, where each string is the translated text for the corresponding line number. "
-            "Example: [\"Hola\", \"Mundo\"]"
+            f"You are a professional dubbing translator working in {self.target_language}. "
+            "Each line below is a translation that is too long to be spoken in its time slot. "
+            "Rewrite each one to at most the given number of characters (spaces not counted), keeping the core meaning "
+            "and the same language. Prefer natural, shorter phrasing over dropping information. "
+            "The input format is 'Line ID: [Max N chars] Original: ... | Translation: ...'. "
+            "Return ONLY a JSON object mapping each line ID to its shortened translation."
+        )
+        user_text = "\n".join(
+            f"{i}: [Max {limit} chars] Original: {segments[i]['text']} | Translation: {translations[i]}"
+            for i, limit in over.items()
         )
-
         try:
+            self.rate_limiter.wait()
             response = self.client.chat.completions.create(
                 model=self.model,
                 messages=[
                     {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": transcript_text}
+                    {"role": "user", "content": user_text}
                 ],
-                # response_format={"type": "json_object"} 
             )
-            
-            content = response.choices[0].message.content.strip()
-            # Clean up potential markdown blocks
-            if content.startswith("```json"):
-                content = content[7:-3]
-            elif content.startswith("```"):
-                content = content[3:-3]
-                
-            translated_list = json.loads(content)
-            
-            if len(translated_list) != len(segments):
-                print(f"[WARNING] Mismatch in translation count ({len(translated_list)} vs {len(segments)}). Fallback mapping.")
-            
-            translated_segments = []
-            for i, seg in enumerate(segments):
-                new_seg = seg.copy()
-                if i < len(translated_list):
-                    new_seg["text_translated"] = translated_list[i]
-                else:
-                    new_seg["text_translated"] = seg["text"] # Fallback
-                translated_segments.append(new_seg)
-
-            return translated_segments
-
-        except (RateLimitError, AuthenticationError, APIConnectionError) as e:
-            print(f"\n[LLM ERROR] {type(e).__name__}: {e}")
-            print("  -> Initiating Fallback to Google Translate...\n")
-            return self._use_fallback_translation(segments)
-
+            shortened = _parse_translations(response.choices[0].message.content, list(over))
         except Exception as e:
-            print(f"[ERROR] LLM Translation failed: {e}")
-            print("  -> Fallback: Using Google Translate.")
-            return self._use_fallback_translation(segments)
+            print(f"[WARNING] Shortening request failed: {e}. Keeping original translations.")
+            return {}
+
+        # Keep a rewrite only if it actually got shorter
+        shortened = {i: text for i, text in shortened.items() if len(text) < len(translations[i])}
+        print(f"  Shortened {len(shortened)}/{len(over)} lines predicted to overrun their slot.")
+        return shortened
+
+    def _translate_chunk(self, segments, indices, context):
+        """
+        Translates one chunk with retries. Returns {index: translation} for the lines
+        the model delivered (possibly partial after the last attempt; never raises).
+        """
+        system_prompt = (
+            f"You are a professional dubbing translator. Translate the following transcript lines to {self.target_language}. "
+            "CRITICAL: The translation must be concise to match the original speaking duration. "
+            "If the target language naturally takes longer, shorten the phrasing or omit filler words while keeping the core meaning. "
+            "The input format is 'Line ID: [Duration: Xs] Text'. "
+            "Lines under CONTEXT are earlier lines given only for continuity; do NOT translate them. "
+            "Return ONLY a JSON object mapping each line ID under TRANSLATE to its translated text. "
+            "Example: {\"12\": \"Hola\", \"13\": \"Mundo\"}"
+        )
+        translations = {}
+        for attempt in range(Config.TRANSLATION_MAX_RETRIES + 1):
+            if self.llm_disabled.is_set():
+                return translations
+            if attempt:
+                time.sleep(min(2 ** attempt, 30))
+            # Retries only ask for the lines still missing
+            pending = [i for i in indices if i not in translations]
+            parts = []
+            if context:
+                parts.append("CONTEXT:")
+                parts.extend(_format_line(i, segments[i]) for i in context)
+            parts.append("TRANSLATE:")
+            parts.extend(_format_line(i, segments[i]) for i in pending)
+            transcript_text = "\n".join(parts)
+            try:
+                self.rate_limiter.wait()
+                response = self.client.chat.completions.create(
+                    model=self.model,
+                    messages=[
+                        {"role": "system", "content": system_prompt},
+                        {"role": "user", "content": transcript_text}
+                    ],
+                    # response_format={"type": "json_object"} 
+                )
+                translations.update(_parse_translations(response.choices[0].message.content, pending))
+                if len(translations) == len(indices):
+                    return translations
+                print(f"[WARNING] Chunk {indices[0]}-{indices[-1]}: got {len(translations)}/{len(indices)} lines (attempt {attempt + 1}).")
+
+            except AuthenticationError as e:
+                print(f"\n[LLM ERROR] {type(e).__name__}: {e}")
+                print("  -> Initiating Fallback to Google Translate for all remaining lines...\n")
+                self.llm_disabled.set() # Retrying (or sending other chunks) cannot help
+                return translations
+
+            except (RateLimitError, APIConnectionError) as e:
+                print(f"[LLM ERROR] Chunk {indices[0]}-{indices[-1]}: {type(e).__name__} (attempt {attempt + 1}).")
+
+            except Exception as e:
+                print(f"[ERROR] Chunk {indices[0]}-{indices[-1]} failed: {e} (attempt {attempt + 1}).")
+
+        return translations
+
+
+LINE_OVERHEAD_TOKENS = 12 # "Line ID: [Duration: Xs]" prefix plus the JSON key/quotes in the reply
+
+
+def _estimate_tokens(text):
+    # ~4 characters per token for Latin scripts; good enough for budgeting
+    return len(text) // 4 + 1
+
+
+def _format_line(i, seg):
+    return f"{i}: [Duration: {seg.get('duration', 0):.2f}s] {seg['text']}"
+
+
+def _parse_translations(content, indices):
+    """Parses the model reply ({id: text}, or a plain list in line order) into {index: text}."""
+    content = content.strip()
+    # Clean up potential markdown blocks
+    if content.startswith("```json"):
+        content = content[7:-3]
+    elif content.startswith("```"):
+        content = content[3:-3]
+
+    data = json.loads(content)
+    if isinstance(data, list):
+        data = {str(i): text for i, text in zip(indices, data)}
+
+    wanted = set(indices)
+    result = {}
+    for key, text in data.items():
+        try:
+            i = int(str(key).strip())
+        except ValueError:
+            continue
+        if i in wanted and isinstance(text, str) and text.strip():
+            result[i] = text
+    return result
+
+
+def _batch_lines(items, max_chars):
+    """Groups [(index, text), ...] into consecutive batches whose newline-joined length stays under max_chars."""
+    batches = []
+    current, size = [], 0
+    for i, text in items:
+        length = len(text) + 1
+        if current and size + length > max_chars:
+            batches.append(current)
+            current, size = [], 0
+        current.append((i, text))
+        size += length
+    if current:
+        batches.append(current)
+    return batches
+
+
+class RateLimiter:
+    """Spaces requests evenly so at most `rpm` start per minute (shared by all worker threads)."""
+
+    def __init__(self, rpm):
+        self.interval = 60.0 / rpm if rpm else 0.0
+        self.next_slot = 0.0
+        self.lock = threading.Lock()
+
+    def wait(self):
+        if not self.interval:
+            return
+        with self.lock:
+            now = time.monotonic()
+            slot = max(now, self.next_slot)
+            self.next_slot = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
 
 if __name__ == "__main__":
     # Test
@@ -0,0 +1,93 @@
+import os
+import multiprocessing
+import concurrent.futures
+import torch
+from src.config import Config
+
+# Parallel synthesis: each worker process loads its own TTS engine once
+_worker_cloner = None
+
+def _init_tts_worker(num_threads):
+    global _worker_cloner
+    torch.set_num_threads(num_threads)
+    from src.modules.voice_cloner import VoiceCloner
+    _worker_cloner = VoiceCloner(device="cpu")
+
+def _synthesize_batch(items, language):
+    results = _worker_cloner.generate_speech_batch(items, language=language)
+    # Engine exceptions are not always picklable; send their message back instead
+    return [(path, RuntimeError(f"{type(error).__name__}: {error}") if error else None) for path, error in results]
+
+
+def available_ram_gb():
+    """
+    Memory currently available for new processes in GB (after the models this process
+    already holds), or None if it cannot be determined.
+    """
+    try:
+        import psutil
+        return psutil.virtual_memory().available / 1024 ** 3
+    except ImportError:
+        pass
+    try:
+        # Free pages only (page cache not counted): a conservative estimate
+        return os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_AVPHYS_PAGES") / 1024 ** 3
+    except (AttributeError, ValueError, OSError):
+        return None
+
+
+class TTSWorkerPool:
+    """
+    CPU-only synthesis pool: N spawned processes each hold one VoiceCloner (engine loaded on
+    first use, then reused) with torch intra-op threads split evenly between them.
+    Work is submitted as speaker-grouped batches; idle workers pull the next one off the queue.
+    """
+
+    def __init__(self, num_workers=None):
+        cores = os.cpu_count() or 1
+        self.num_workers = num_workers or self.default_workers()
+        self.threads = max(1, cores // self.num_workers)
+        print(f"Starting TTS worker pool: {self.num_workers} processes x {self.threads} threads")
+
+        self.pool = concurrent.futures.ProcessPoolExecutor(
+            max_workers=self.num_workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_tts_worker,
+            initargs=(self.threads,)
+        )
+
+    @staticmethod
+    def default_workers():
+        """
+        Workers that fit this host: at most one per TTS_MIN_THREADS_PER_WORKER cores,
+        and at most one per TTS_WORKER_RAM_GB of available memory (each process holds its own model).
+        """
+        cores = os.cpu_count() or 1
+        by_cores = max(1, cores // Config.TTS_MIN_THREADS_PER_WORKER)
+        ram_gb = available_ram_gb()
+        by_ram = max(1, int(ram_gb // Config.TTS_WORKER_RAM_GB)) if ram_gb else by_cores
+        return min(by_cores, by_ram)
+
+    def submit(self, items, language):
+        """
+        Splits items (see VoiceCloner.generate_speech_batch) into speaker-grouped batches,
+        about one per worker. Returns a list of (item_indices, future) pairs; each future
+        resolves to one (output_path, error) per index.
+        """
+        order = sorted(range(len(items)), key=lambda k: (items[k]['reference_audio_path'], len(items[k]['text'])))
+        size = max(1, -(-len(order) // self.num_workers))
+        submitted = []
+        for b in range(0, len(order), size):
+            indices = order[b:b + size]
+            future = self.pool.submit(_synthesize_batch, [items[k] for k in indices], language)
+            submitted.append((indices, future))
+        return submitted
+
+    def shutdown(self):
+        self.pool.shutdown(wait=True, cancel_futures=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.shutdown()
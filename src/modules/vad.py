@@ -0,0 +1,152 @@
+import json
+import numpy as np
+import librosa
+from src.config import Config
+
+SAMPLE_RATE = 16000 # Whisper / wav2vec2 native rate
+
+
+class VoiceActivityDetector:
+    def __init__(self, top_db=None, min_speech=None, min_silence=None, pad=None):
+        # Energy-based VAD: Demucs vocals are near-digital-silence outside speech,
+        # so a relative dB gate is reliable and costs almost nothing on CPU.
+        self.top_db = top_db if top_db is not None else Config.VAD_TOP_DB
+        self.min_speech = min_speech if min_speech is not None else Config.VAD_MIN_SPEECH
+        self.min_silence = min_silence if min_silence is not None else Config.VAD_MIN_SILENCE
+        self.pad = pad if pad is not None else Config.VAD_PAD
+
+    def load_audio(self, audio_path, sr=SAMPLE_RATE):
+        y, _ = librosa.load(audio_path, sr=sr, mono=True)
+        return y.astype(np.float32)
+
+    def detect(self, y, sr=SAMPLE_RATE):
+        """
+        Finds speech regions in a mono waveform.
+        Returns a sorted list of (start, end) tuples in seconds.
+        """
+        if len(y) == 0:
+            return []
+
+        intervals = librosa.effects.split(y, top_db=self.top_db, frame_length=1024, hop_length=256)
+        total = len(y) / sr
+
+        regions = []
+        for start, end in intervals:
+            start_s = max(0.0, start / sr - self.pad)
+            end_s = min(total, end / sr + self.pad)
+            # Merge regions separated by short pauses (keeps sentences in one piece)
+            if regions and start_s - regions[-1][1] < self.min_silence:
+                regions[-1] = (regions[-1][0], max(regions[-1][1], end_s))
+            else:
+                regions.append((start_s, end_s))
+
+        return [(s, e) for s, e in regions if e - s >= self.min_speech]
+
+    def compact(self, y, regions, sr=SAMPLE_RATE, gap=0.3):
+        """
+        Concatenates the speech regions (separated by a short silence) so the ASR model
+        decodes them in one batched pass.
+        Returns (compact_audio, offsets) where offsets is a list of
+        (compact_start, original_start, duration) used by map_time().
+        """
+        silence = np.zeros(int(gap * sr), dtype=y.dtype)
+        pieces = []
+        offsets = []
+        cursor = 0.0
+        for start, end in regions:
+            clip = y[int(start * sr):int(end * sr)]
+            if len(clip) == 0:
+                continue
+            offsets.append((cursor, start, len(clip) / sr))
+            pieces.extend([clip, silence])
+            cursor += (len(clip) + len(silence)) / sr
+
+        if not pieces:
+            return np.zeros(0, dtype=y.dtype), []
+        return np.concatenate(pieces), offsets
+
+    @staticmethod
+    def map_time(t, offsets):
+        """Maps a timestamp on the compacted audio back to the original timeline."""
+        if not offsets:
+            return t
+        compact_starts = np.array([o[0] for o in offsets])
+        idx = max(0, int(np.searchsorted(compact_starts, t, side="right")) - 1)
+        compact_start, original_start, duration = offsets[idx]
+        # Timestamps inside the inserted gap snap to the end of the preceding region
+        return original_start + min(max(t - compact_start, 0.0), duration)
+
+
+class SpeechIndex:
+    """
+    Speech regions of one job's vocal track, computed once and shared by every stage.
+    Regions are kept as sorted start/end arrays with a prefix sum of their lengths,
+    so range queries are O(log n).
+    """
+
+    def __init__(self, regions, duration):
+        regions = sorted(regions)
+        self.starts = np.array([s for s, _ in regions], dtype=np.float64)
+        self.ends = np.array([e for _, e in regions], dtype=np.float64)
+        self.duration = float(duration)
+        self._cum = np.concatenate(([0.0], np.cumsum(self.ends - self.starts)))
+
+    @classmethod
+    def from_audio(cls, audio_path, vad=None):
+        vad = vad or VoiceActivityDetector()
+        y = vad.load_audio(audio_path)
+        return cls(vad.detect(y), len(y) / SAMPLE_RATE)
+
+    @property
+    def total_speech(self):
+        return float(self._cum[-1])
+
+    def regions(self):
+        return list(zip(self.starts.tolist(), self.ends.tolist()))
+
+    def _covered(self, t):
+        # Speech time in [0, t]
+        i = int(np.searchsorted(self.starts, t, side="right"))
+        if i == 0:
+            return 0.0
+        return float(self._cum[i - 1] + min(t, self.ends[i - 1]) - self.starts[i - 1])
+
+    def speech_in(self, start, end):
+        """Seconds of speech inside [start, end]."""
+        if end <= start:
+            return 0.0
+        return self._covered(end) - self._covered(start)
+
+    def fraction(self, start, end):
+        """Share of [start, end] that is speech (0..1)."""
+        return self.speech_in(start, end) / (end - start) if end > start else 0.0
+
+    def is_speech(self, t):
+        i = int(np.searchsorted(self.starts, t, side="right")) - 1
+        return i >= 0 and t < self.ends[i]
+
+    def regions_in(self, start, end):
+        """Speech regions clipped to [start, end]."""
+        lo = int(np.searchsorted(self.ends, start, side="right"))
+        hi = int(np.searchsorted(self.starts, end, side="left"))
+        return [(max(s, start), min(e, end)) for s, e in zip(self.starts[lo:hi].tolist(), self.ends[lo:hi].tolist())]
+
+    def union(self, other):
+        """Index of time that is speech in either index (overlapping regions merged)."""
+        merged = []
+        for start, end in sorted(self.regions() + other.regions()):
+            if merged and start <= merged[-1][1]:
+                merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+            else:
+                merged.append((start, end))
+        return SpeechIndex(merged, max(self.duration, other.duration))
+
+    def save(self, path):
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump({"duration": self.duration, "regions": self.regions()}, f)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        return cls([tuple(r) for r in data["regions"]], data["duration"])
@@ -0,0 +1,106 @@
+import os
+import json
+import time
+import shutil
+import numpy as np
+from src.config import Config
+
+
+class VoiceBank:
+    """
+    Persistent cross-video speaker registry.
+    Each known voice keeps its embedding and a cleaned reference clip, so recurring
+    speakers skip reference building entirely. (TTS conditioning for a bank reference is
+    cached by content hash under CACHE_DIR like any other reference.)
+
+    Layout: <bank_dir>/index.json and <bank_dir>/<voice_id>/{embedding.npy, reference.wav}
+    """
+
+    # Only neural embeddings separate speakers reliably across recordings
+    MATCHABLE_BACKENDS = ("pyannote",)
+
+    def __init__(self, bank_dir=None):
+        self.bank_dir = bank_dir or Config.VOICE_BANK_DIR
+        self.index_path = os.path.join(self.bank_dir, "index.json")
+        os.makedirs(self.bank_dir, exist_ok=True)
+
+        self.index = {"voices": {}}
+        if os.path.exists(self.index_path):
+            try:
+                with open(self.index_path, 'r', encoding='utf-8') as f:
+                    self.index = json.load(f)
+            except Exception as e:
+                print(f"[WARNING] Voice bank index unreadable ({e}). Starting a new one.")
+
+        self.embeddings = {}
+        for voice_id in self.index["voices"]:
+            emb_path = os.path.join(self.bank_dir, voice_id, "embedding.npy")
+            if os.path.exists(emb_path):
+                self.embeddings[voice_id] = np.load(emb_path)
+
+        print(f"Voice bank: {len(self.embeddings)} known voices in {self.bank_dir}")
+
+    def match(self, embedding, backend, threshold, exclude=()):
+        """
+        Finds the closest known voice embedded with the same backend.
+        Returns (voice_id, similarity); voice_id is None below the threshold.
+        `exclude` skips voices already claimed by another speaker in the same job.
+        """
+        best_id, best_score = None, -1.0
+        if backend not in self.MATCHABLE_BACKENDS:
+            return None, best_score
+        for voice_id, known in self.embeddings.items():
+            if voice_id in exclude:
+                continue
+            if self.index["voices"][voice_id].get("backend") != backend or known.shape != embedding.shape:
+                continue
+            score = float(np.dot(known, embedding))
+            if score > best_score:
+                best_id, best_score = voice_id, score
+        if best_score < threshold:
+            return None, best_score
+        return best_id, best_score
+
+    def enroll(self, embedding, reference_path, backend, source=None):
+        """Registers a new voice with its cleaned reference clip. Returns the new voice id."""
+        voice_id = f"VOICE_{len(self.index['voices']):04d}"
+        while voice_id in self.index["voices"]:
+            voice_id = f"VOICE_{int(voice_id.split('_')[1]) + 1:04d}"
+
+        voice_dir = os.path.join(self.bank_dir, voice_id)
+        os.makedirs(voice_dir, exist_ok=True)
+        shutil.copy2(reference_path, os.path.join(voice_dir, "reference.wav"))
+        np.save(os.path.join(voice_dir, "embedding.npy"), embedding)
+
+        self.embeddings[voice_id] = embedding
+        self.index["voices"][voice_id] = {
+            "backend": backend,
+            "count": 1,
+            "created": time.strftime("%Y-%m-%d %H:%M:%S"),
+            "sources": [source] if source else []
+        }
+        self._save()
+        return voice_id
+
+    def update(self, voice_id, embedding, source=None):
+        """Folds a new observation into the voice's running-mean embedding."""
+        entry = self.index["voices"][voice_id]
+        count = entry.get("count", 1)
+        merged = (self.embeddings[voice_id] * count + embedding) / (count + 1)
+        merged /= max(np.linalg.norm(merged), 1e-9)
+
+        self.embeddings[voice_id] = merged
+        np.save(os.path.join(self.bank_dir, voice_id, "embedding.npy"), merged)
+        entry["count"] = count + 1
+        if source and source not in entry["sources"]:
+            entry["sources"].append(source)
+        self._save()
+
+    def reference_path(self, voice_id):
+        return os.path.join(self.bank_dir, voice_id, "reference.wav")
+
+    def _save(self):
+        tmp_path = self.index_path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.index, f, indent=2)
+        os.replace(tmp_path, self.index_path)
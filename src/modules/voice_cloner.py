@@ -1,7 +1,10 @@
 import torch
 import torchaudio
 import os
-from chatterbox.tts import ChatterboxTTS
+import threading
+from chatterbox.tts import ChatterboxTTS, Conditionals
+from src.config import Config
+from src.cache import file_hash, make_key, cache_path
 
 # Monkey-patch torchaudio if needed for Windows/ffmpeg interaction
 if not hasattr(torchaudio, "list_audio_backends"):
@@ -9,6 +12,10 @@ if not hasattr(torchaudio, "list_audio_backends"):
         return ["ffmpeg", "soundfile"]
     torchaudio.list_audio_backends = _list_audio_backends
 
+# Sampling settings tts_to_file takes from the XTTS config (Xtts.synthesize)
+XTTS_SAMPLING_SETTINGS = ("temperature", "length_penalty", "repetition_penalty", "top_k", "top_p")
+XTTS_SENTENCE_GAP = 10000 # Samples of silence the TTS synthesizer appends after each sentence
+
 class VoiceCloner:
     def __init__(self, device=None):
         self.device = device if device else ("cuda" if torch.cuda.is_available() else "cpu")
@@ -19,6 +26,18 @@ class VoiceCloner:
         self.model = None  # Chatterbox (for English) - loads on first use
         self.coqui_model = None  # Coqui XTTS (for other languages) - loads on first use
 
+        # Speaker conditioning (XTTS latents / Chatterbox conds) computed once per reference file
+        self._conditioning = {}
+        self._reference_hashes = {}
+
+    def analysis_fields(self, language):
+        """
+        Segment analysis fields ('emotion', 'pitch', 'energy', ...) the engine for this
+        language actually uses. Neither Chatterbox nor XTTS take emotion/prosody
+        conditioning today, so the orchestrator can skip that analysis entirely.
+        """
+        return set()
+
     def generate_speech(self, text, reference_audio_path, language="en", output_path="output.wav", emotion="default"):
         """
         Generates speech using Chatterbox (En) or Coqui XTTS (Ur/Hi/etc).
@@ -59,7 +78,8 @@ class VoiceCloner:
             # Try using Chatterbox if loaded
             if self.model and self.model != "FAILED":
                 try:
-                    wav = self.model.generate(text, audio_prompt_path=reference_audio_path)
+                    self.model.conds = self._chatterbox_conditioning(reference_audio_path)
+                    wav = self.model.generate(text)
                     torchaudio.save(output_path, wav, self.model.sr)
                     return output_path
                 except Exception as e:
@@ -82,14 +102,31 @@ class VoiceCloner:
                 self.coqui_model = TTS("tts_models/multilingual/multi-dataset/xtts_v2").to(self.device)
                 print("✅ Coqui XTTS loaded successfully")
             
-            # XTTS Generation
-            self.coqui_model.tts_to_file(
-                text=text,
-                file_path=output_path,
-                speaker_wav=reference_audio_path,
-                language=language,
-                split_sentences=True
-            )
+            # XTTS Generation (reusing the speaker's cached conditioning latents)
+            try:
+                tts_model = self.coqui_model.synthesizer.tts_model
+                gpt_cond_latent, speaker_embedding = self._xtts_conditioning(reference_audio_path)
+            except Exception as e:
+                print(f"[WARNING] XTTS conditioning cache unavailable ({e}). Using tts_to_file.")
+                self.coqui_model.tts_to_file(
+                    text=text,
+                    file_path=output_path,
+                    speaker_wav=reference_audio_path,
+                    language=language,
+                    split_sentences=True
+                )
+                return output_path
+
+            # Same as tts_to_file(split_sentences=True): one inference per sentence with the
+            # config's sampling settings, each followed by the synthesizer's silence gap,
+            # written by the synthesizer (peak-normalized int16 at the model's sample rate)
+            settings = {name: getattr(tts_model.config, name) for name in XTTS_SAMPLING_SETTINGS}
+            pieces = []
+            for sentence in self.coqui_model.synthesizer.split_into_sentences(text):
+                out = tts_model.inference(sentence, language, gpt_cond_latent, speaker_embedding, **settings)
+                pieces.append(torch.as_tensor(out["wav"]).float().reshape(-1).cpu())
+                pieces.append(torch.zeros(XTTS_SENTENCE_GAP))
+            self.coqui_model.synthesizer.save_wav(wav=torch.cat(pieces).numpy(), path=output_path)
             return output_path
             
         except ImportError:
@@ -99,5 +136,109 @@ class VoiceCloner:
             print(f"Coqui XTTS generation failed: {e}")
             raise
 
+    def generate_speech_batch(self, items, language="en"):
+        """
+        Synthesizes several segments in one call.
+        items: list of dicts {text, reference_audio_path, output_path, emotion (optional)}.
+        Segments are grouped by speaker reference (conditioning is looked up once per group)
+        and ordered by text length within a group. Neither Chatterbox nor XTTS exposes a batched
+        forward pass, so each segment is still decoded on its own, without autograd bookkeeping.
+        Returns one (output_path, error) tuple per item, in input order.
+        """
+        order = sorted(range(len(items)), key=lambda k: (items[k]['reference_audio_path'], len(items[k]['text'])))
+        results = [None] * len(items)
+        with torch.inference_mode():
+            for k in order:
+                item = items[k]
+                try:
+                    path = self.generate_speech(
+                        text=item['text'],
+                        reference_audio_path=item['reference_audio_path'],
+                        language=language,
+                        output_path=item['output_path'],
+                        emotion=item.get('emotion', 'default')
+                    )
+                    results[k] = (path, None)
+                except Exception as e:
+                    results[k] = (None, e)
+        return results
+
+    def _conditioning_key(self, engine, reference_audio_path, options=None):
+        """Cache key from the reference's content hash (hashed once per file version) and engine options."""
+        stat = os.stat(reference_audio_path)
+        memo = (os.path.abspath(reference_audio_path), stat.st_mtime_ns, stat.st_size)
+        if memo not in self._reference_hashes:
+            self._reference_hashes[memo] = file_hash(reference_audio_path)
+        return make_key(engine, self._reference_hashes[memo], options)
+
+    def _xtts_conditioning(self, reference_audio_path):
+        """(gpt_cond_latent, speaker_embedding) for a reference: memory, then disk, then computed."""
+        config = self.coqui_model.synthesizer.tts_model.config
+        # The cloning settings tts_to_file uses (Xtts.full_inference reads them from the config)
+        options = {
+            "gpt_cond_len": config.gpt_cond_len,
+            "gpt_cond_chunk_len": config.gpt_cond_chunk_len,
+            "max_ref_length": config.max_ref_len,
+            "sound_norm_refs": config.sound_norm_refs
+        }
+        key = self._conditioning_key("xtts_v2", reference_audio_path, options)
+        if key in self._conditioning:
+            return self._conditioning[key]
+
+        path = cache_path("tts_conditioning", key, ".pt")
+        latents = None
+        if Config.TTS_CONDITIONING_CACHE and os.path.exists(path):
+            try:
+                data = torch.load(path, map_location=self.device)
+                latents = (data["gpt_cond_latent"], data["speaker_embedding"])
+            except Exception as e:
+                print(f"[WARNING] Unreadable XTTS conditioning cache ({e}). Recomputing.")
+        if latents is None:
+            print(f"Computing XTTS speaker conditioning for {os.path.basename(reference_audio_path)}...")
+            latents = self.coqui_model.synthesizer.tts_model.get_conditioning_latents(audio_path=[reference_audio_path], **options)
+            if Config.TTS_CONDITIONING_CACHE:
+                _save_atomic(lambda tmp: torch.save({"gpt_cond_latent": latents[0].cpu(), "speaker_embedding": latents[1].cpu()}, tmp), path)
+
+        self._conditioning[key] = latents
+        return latents
+
+    def _chatterbox_conditioning(self, reference_audio_path):
+        """Chatterbox Conditionals for a reference: memory, then disk, then computed."""
+        key = self._conditioning_key("chatterbox", reference_audio_path)
+        if key in self._conditioning:
+            return self._conditioning[key]
+
+        path = cache_path("tts_conditioning", key, ".pt")
+        conds = None
+        if Config.TTS_CONDITIONING_CACHE and os.path.exists(path):
+            try:
+                conds = Conditionals.load(path, map_location=self.device).to(self.device)
+            except Exception as e:
+                # A cache problem must not send the segment to the XTTS fallback (different voice)
+                print(f"[WARNING] Unreadable Chatterbox conditioning cache ({e}). Recomputing.")
+        if conds is None:
+            print(f"Computing Chatterbox speaker conditioning for {os.path.basename(reference_audio_path)}...")
+            self.model.prepare_conditionals(reference_audio_path)
+            conds = self.model.conds
+            if Config.TTS_CONDITIONING_CACHE:
+                _save_atomic(conds.save, path)
+
+        self._conditioning[key] = conds
+        return conds
+
+def _save_atomic(save, path):
+    """
+    Runs save(tmp_path) and moves the result into place, so concurrent TTS workers never
+    read a half-written cache file. A failed write only loses the cache entry.
+    """
+    tmp_path = f"{path}.{os.getpid()}_{threading.get_ident()}.part"
+    try:
+        save(tmp_path)
+        os.replace(tmp_path, path)
+    except Exception as e:
+        print(f"[WARNING] Could not write conditioning cache ({e}).")
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
 if __name__ == "__main__":
     pass
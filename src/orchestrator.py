@@ -13,12 +13,16 @@ from src.modules.video_assembler import VideoAssembler
 from src.modules.diarizer import SpeakerDiarizer
 from src.modules.lipsync import LipSyncer
 from src.modules.cleaner import AudioCleaner
+from src.modules.voice_bank import VoiceBank
+from src.modules.vad import SpeechIndex
+from src.modules.tts_pool import TTSWorkerPool
 try:
     from src.modules.rvc import RVCInference
 except ImportError:
     RVCInference = None
     print("[WARNING] RVC (Voice Refining) dependencies not found. RVC features will be disabled.")
 from pydub import AudioSegment
+import contextlib
 import concurrent.futures
 from tqdm import tqdm
 
@@ -33,8 +37,8 @@ class Orchestrator:
         self.extractor = AudioExtractor(output_dir=self.temp_dir)
         self.separator = AudioSeparator(output_dir=self.temp_dir)
         self.cleaner = AudioCleaner(output_dir=self.temp_dir) # New Cleaner
-        self.transcriber = Transcriber(model_size=Config.WHISPER_MODEL_SIZE)
-        self.emotion_analyzer = EmotionAnalyzer()
+        self.transcriber = Transcriber(model_size=Config.WHISPER_MODEL_SIZE, backend=Config.ASR_BACKEND)
+        self.emotion_analyzer = None # Lazy Load (skipped when the TTS engine ignores emotion)
         self.translator = None # Initialize lazily
         self.voice_cloner = VoiceCloner() # Chatterbox Client
         self.aligner = AudioAligner()
@@ -42,8 +46,9 @@ class Orchestrator:
         self.diarizer = SpeakerDiarizer() # New Diarizer Module
         self.lipsyncer = LipSyncer() # Wav2Lip Module
         self.rvc_handler = None # RVC Module (Lazy Load)
+        self.voice_bank = VoiceBank() if Config.USE_VOICE_BANK else None
 
-    def run_pipeline(self, video_path, target_language, tone_preference=None, translation_service=None, lip_sync=True, rvc_model_path=None, rvc_index_path=None, keep_bgm=True, progress_callback=None):
+    def run_pipeline(self, video_path, target_language, tone_preference=None, translation_service=None, lip_sync=True, rvc_model_path=None, rvc_index_path=None, keep_bgm=True, progress_callback=None, transcript_path=None):
         def log_progress(step_msg):
             print(f"\n[{step_msg}]")
             if progress_callback:
@@ -85,10 +90,34 @@ class Orchestrator:
         
         # Use vocals for processing if available, else fallback to original
         processing_audio = vocals_path if vocals_path else original_audio
+
+        # 1.55 Optional full-track denoise for ASR (streams block-wise; runs while the speech index is built)
+        # Written to the job's temp dir only: Demucs output differs between runs, so caching it would never hit
+        asr_audio_future = None
+        if Config.CLEAN_VOCALS_FOR_ASR and not transcript_path and processing_audio != original_audio:
+            clean_executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+            asr_audio_future = clean_executor.submit(self.cleaner.clean_audio, processing_audio, "_asr", use_cache=False)
+            clean_executor.shutdown(wait=False)
+
+        # 1.6 Speech Activity Index (computed once, shared by ASR, diarization and emotion)
+        speech_index = None
+        if Config.USE_VAD:
+            log_progress("Step 1.6/10: Indexing Speech Activity...")
+            speech_index = SpeechIndex.from_audio(processing_audio)
+            print(f"  Speech: {speech_index.total_speech:.1f}s of {speech_index.duration:.1f}s")
         
         # 2. Transcription
-        log_progress("Step 2/10: Transcribing...")
-        segments = self.transcriber.transcribe(processing_audio)
+        if transcript_path:
+            # Start from an existing transcript (saved by a previous run) and skip ASR entirely
+            log_progress("Step 2/10: Loading Existing Transcript...")
+            segments = self.transcriber.load_transcription(transcript_path)
+        else:
+            log_progress("Step 2/10: Transcribing...")
+            # Key the transcript cache on the extracted audio: Demucs output differs slightly between runs
+            cache_source = original_audio if processing_audio != original_audio else None
+            asr_audio = asr_audio_future.result() if asr_audio_future else processing_audio
+            segments = self.transcriber.transcribe(asr_audio, cache_source=cache_source, speech_index=speech_index)
+            self.transcriber.save_transcription(segments, os.path.join(self.temp_dir, "transcript.json"))
         if not segments:
             print("No speech detected.")
             return
@@ -96,7 +125,7 @@ class Orchestrator:
         # 2.5 Diarization (Speaker Identification)
         # 2.5 Diarization (Speaker Identification)
         log_progress("Step 2.5/10: Performing Speaker Diarization...")
-        diarization_results = self.diarizer.diarize(processing_audio)
+        diarization_results = self.diarizer.diarize(processing_audio, speech_index=speech_index)
         segments = self.diarizer.assign_speakers_to_segments(segments, diarization_results)
 
         # 3. Emotion Analysis & Ref Audio Splitting
@@ -118,21 +147,39 @@ class Orchestrator:
             seg['audio_path'] = seg_audio_path
             seg['duration'] = duration
             
-            emo_stats = self.emotion_analyzer.analyze_segment(seg_audio_path)
-            seg.update(emo_stats)
-            
             speaker = seg.get('speaker', 'UNKNOWN')
             if speaker not in speaker_segments_map:
                 speaker_segments_map[speaker] = []
             speaker_segments_map[speaker].append(seg)
-            
-            print(f"  Ref Seg {i}: '{seg['text'][:15]}...' [{speaker}] -> {emo_stats['emotion']}")
+
+        # Emotion/prosody for all segments at once (single decode, batched classifier)
+        if self._needs_emotion_analysis(target_language, tone_preference):
+            if self.emotion_analyzer is None:
+                self.emotion_analyzer = EmotionAnalyzer()
+            speech_fractions = [speech_index.fraction(seg['start'], seg['end']) for seg in segments] if speech_index else None
+            all_stats = self.emotion_analyzer.analyze_segments(processing_audio, segments, speech_fractions)
+            for i, (seg, emo_stats) in enumerate(zip(segments, all_stats)):
+                seg.update(emo_stats)
+                print(f"  Ref Seg {i}: '{seg['text'][:15]}...' [{seg.get('speaker', 'UNKNOWN')}] -> {emo_stats['emotion']}")
+        else:
+            print("  Emotion analysis skipped (not used by the selected TTS engine/options).")
 
         # Determine Best Reference for each Speaker
         # Determine Best Reference for each Speaker (Merged Strategy)
         log_progress("Step 3.5/10: Creating Merged Voice References (Smart Cloning)...")
         speaker_refs = {}
+        claimed_voices = set() # One bank voice per diarized speaker within a job
+        pending_refs = {} # { spk: (merged_ref_path, embedding) } -> cleaned together below
         for spk, spk_segments in speaker_segments_map.items():
+            # Known voice? Reuse its stored reference and skip merging/cleaning
+            voice_id, spk_embedding = self._match_known_voice(spk, spk_segments, video_path, claimed_voices)
+            if voice_id:
+                claimed_voices.add(voice_id)
+                speaker_refs[spk] = self.voice_bank.reference_path(voice_id)
+                for seg in spk_segments:
+                    seg['voice_id'] = voice_id
+                continue
+
             # Filter for decent length segments (>1s) to avoid noise
             valid_segs = [s for s in spk_segments if s['duration'] > 1.0]
             if not valid_segs:
@@ -153,24 +200,34 @@ class Orchestrator:
                 # Export merged reference
                 merged_ref_path = os.path.join(self.temp_dir, f"ref_{spk}_merged.wav")
                 merged_audio.export(merged_ref_path, format="wav")
-                
-                # CLEAN THE REFERENCE (New Step)
-                # Removes reverb/hiss/rumble to avoid "stage voice" artifacts
-                cleaned_ref_path = self.cleaner.clean_audio(merged_ref_path)
-                
-                speaker_refs[spk] = cleaned_ref_path
-                print(f"  -> Generated Master Reference: {os.path.basename(cleaned_ref_path)} ({merged_audio.duration_seconds:.2f}s)")
+                pending_refs[spk] = (merged_ref_path, spk_embedding)
+                print(f"  -> Merged reference: {os.path.basename(merged_ref_path)} ({merged_audio.duration_seconds:.2f}s)")
             except Exception as e:
                 print(f"  [WARNING] Failed to merge references for {spk}: {e}. Falling back to single best clip.")
                 best_seg = max(spk_segments, key=lambda s: s['duration'])
                 # Clean fallback too
-                speaker_refs[spk] = self.cleaner.clean_audio(best_seg['audio_path'])
+                pending_refs[spk] = (best_seg['audio_path'], None)
+
+        # CLEAN THE REFERENCES (all speakers in parallel, cached by content)
+        # Removes reverb/hiss/rumble to avoid "stage voice" artifacts
+        cleaned_paths = self.cleaner.clean_many([path for path, _ in pending_refs.values()])
+        for (spk, (_, spk_embedding)), cleaned_ref_path in zip(pending_refs.items(), cleaned_paths):
+            speaker_refs[spk] = cleaned_ref_path
+            print(f"  Speaker {spk}: Master Reference {os.path.basename(cleaned_ref_path)}")
+
+            if spk_embedding is not None:
+                voice_id = self.voice_bank.enroll(spk_embedding, cleaned_ref_path, self.diarizer.get_embedder().backend, source=os.path.basename(video_path))
+                claimed_voices.add(voice_id)
+                for seg in speaker_segments_map[spk]:
+                    seg['voice_id'] = voice_id
+                print(f"  -> Enrolled in voice bank as {voice_id}")
 
         # 4. Translation
         # 4. Translation
         log_progress(f"Step 4/10: Translating to {target_language}...")
         self.translator = Translator(target_language=target_language, service_override=translation_service)
-        segments = self.translator.translate_segments(segments)
+        # Streamed: TTS below starts on the first translated chunk while later chunks are still in flight
+        translated_stream = self.translator.translate_segments_stream(segments)
 
         # 5 & 6 & 7. Cloning, TTS, Alignment (Parallelized Alignment)
         # 5 & 6 & 7. Cloning, TTS, Alignment (Parallelized Alignment)
@@ -179,43 +236,21 @@ class Orchestrator:
         alignment_futures = []
         
         # We use a ThreadPool for the alignment step (ffmpeg I/O bound), 
-        # while keeping TTS generation sequential to avoid GPU conflicts/OOM.
-        with concurrent.futures.ThreadPoolExecutor(max_workers=os.cpu_count()) as executor:
-            for i, seg in enumerate(tqdm(segments, desc="Dubbing Segments")):
-                text_to_speak = seg['text_translated']
-                
-                # Determine Reference Audio
-                speaker = seg.get('speaker', 'UNKNOWN')
-                global_ref = speaker_refs.get(speaker, seg['audio_path']) 
-                
-                # Dynamic Reference Strategy (Disabled for Stability - User reported regression)
-                # if target_language != 'en':
-                #     if seg.get('duration', 0) > 3.0 and os.path.exists(seg['audio_path']):
-                #         ref_audio = seg['audio_path']
-                #     else:
-                #         ref_audio = global_ref
-                # else:
-                ref_audio = global_ref 
-                
+        # while keeping TTS generation sequential to avoid GPU conflicts/OOM
+        # (on CPU-only hosts, TTS_WORKERS spreads it over worker processes instead).
+        tts_workers = (Config.TTS_WORKERS or TTSWorkerPool.default_workers()) if self.voice_cloner.device == "cpu" else 1
+        with concurrent.futures.ThreadPoolExecutor(max_workers=os.cpu_count()) as executor, \
+                (TTSWorkerPool(tts_workers) if tts_workers > 1 else contextlib.nullcontext()) as tts_pool:
+
+            def finish_segment(i, seg, raw_dub_path, error):
+                """RVC + alignment for a synthesized segment, or the original-audio fallback."""
                 target_duration = seg['end'] - seg['start']
-                emotion = seg.get('emotion', 'default')
-                if tone_preference: emotion = tone_preference
-                
-                # print(f"  Processing Seg {i}: [{speaker}]") # tqdm handles progress
-                
-                raw_dub_path = os.path.join(self.temp_dir, f"seg_{i}_dub_raw.wav")
                 aligned_dub_path = os.path.join(self.temp_dir, f"seg_{i}_dub_aligned.wav")
-                
+
                 try:
-                    # 1. Generate (Sequential - GPU Safe)
-                    self.voice_cloner.generate_speech(
-                        text=text_to_speak,
-                        reference_audio_path=ref_audio,
-                        language=target_language,
-                        output_path=raw_dub_path,
-                        emotion=emotion
-                    )
-                    
+                    if error:
+                        raise error
+
                     # 1.5 RVC Voice Refining (Optional)
                     audio_to_align = raw_dub_path
                     if rvc_model_path:
@@ -250,6 +285,74 @@ class Orchestrator:
                     else:
                         print("  -> Critical: Original audio not found. Skipping.")
 
+            # Translated segments are buffered and synthesized a batch at a time (grouped by speaker)
+            pending = []
+            tts_jobs = [] # (pending entries, future) in flight on the TTS worker pool
+
+            def collect(progress, wait=False):
+                """Finishes worker-pool batches that are done (all of them with wait=True)."""
+                still_running = []
+                for entries, future in tts_jobs:
+                    if not (wait or future.done()):
+                        still_running.append((entries, future))
+                        continue
+                    try:
+                        results = future.result()
+                    except Exception as e:
+                        # Worker process died: every segment of the batch falls back
+                        results = [(None, e)] * len(entries)
+                    for (i, seg, item), (_, error) in zip(entries, results):
+                        finish_segment(i, seg, item['output_path'], error)
+                    progress.update(len(entries))
+                tts_jobs[:] = still_running
+
+            def flush(progress):
+                if tts_pool:
+                    # 1. Generate (Parallel - CPU worker processes); finished batches are collected as we go
+                    for indices, future in tts_pool.submit([item for _, _, item in pending], target_language):
+                        tts_jobs.append(([pending[k] for k in indices], future))
+                    collect(progress)
+                else:
+                    # 1. Generate (Sequential - GPU Safe)
+                    results = self.voice_cloner.generate_speech_batch([item for _, _, item in pending], language=target_language)
+                    for (i, seg, item), (_, error) in zip(pending, results):
+                        finish_segment(i, seg, item['output_path'], error)
+                    progress.update(len(pending))
+                pending.clear()
+
+            with tqdm(total=len(segments), desc="Dubbing Segments") as progress:
+                for i, seg in translated_stream:
+                    segments[i] = seg
+                    
+                    # Determine Reference Audio
+                    speaker = seg.get('speaker', 'UNKNOWN')
+                    global_ref = speaker_refs.get(speaker, seg['audio_path']) 
+                    
+                    # Dynamic Reference Strategy (Disabled for Stability - User reported regression)
+                    # if target_language != 'en':
+                    #     if seg.get('duration', 0) > 3.0 and os.path.exists(seg['audio_path']):
+                    #         ref_audio = seg['audio_path']
+                    #     else:
+                    #         ref_audio = global_ref
+                    # else:
+                    ref_audio = global_ref 
+                    
+                    emotion = seg.get('emotion', 'default')
+                    if tone_preference: emotion = tone_preference
+
+                    pending.append((i, seg, {
+                        'text': seg['text_translated'],
+                        'reference_audio_path': ref_audio,
+                        'output_path': os.path.join(self.temp_dir, f"seg_{i}_dub_raw.wav"),
+                        'emotion': emotion
+                    }))
+                    if len(pending) >= Config.TTS_BATCH_SIZE:
+                        flush(progress)
+
+                if pending:
+                    flush(progress)
+                collect(progress, wait=True)
+
             # Collect Results from Futures
             print("Waiting for background alignment tasks...")
             for future, start, end in alignment_futures:
@@ -263,8 +366,7 @@ class Orchestrator:
                 except Exception as e:
                      print(f"Alignment Task Failed: {e}")
 
-        # Ensure clips are sorted by start time (concurrency might have jumbled append order if we used as_completed, 
-        # but here we iterated futures in order. Still good practice).
+        # Ensure clips are sorted by start time (segments arrive in translation-completion order)
         generated_clips.sort(key=lambda x: x['start'])
         
         # 8. Assembly
@@ -286,8 +388,15 @@ class Orchestrator:
         if lip_sync:
             log_progress("Step 10/10: Morphing Lips (Wav2Lip) - This takes time...")
             lip_synced_video_path = final_video_path.replace(".mp4", "_lipsynced.mp4")
+            speech_regions_path = None
+            if speech_index:
+                # Wav2Lip follows the dub, which can run past the source speech (stretching is
+                # capped, clips overlap): skip only frames silent in both tracks
+                lip_index = speech_index.union(SpeechIndex.from_audio(merged_audio_path))
+                speech_regions_path = os.path.join(self.temp_dir, "speech_regions.json")
+                lip_index.save(speech_regions_path)
             try:
-                final_output = self.lipsyncer.sync_lips(final_video_path, merged_audio_path, lip_synced_video_path)
+                final_output = self.lipsyncer.sync_lips(final_video_path, merged_audio_path, lip_synced_video_path, speech_regions_path=speech_regions_path)
                 print(f"Final Studio Output: {final_output}")
                 return final_output
             except Exception as e:
@@ -297,6 +406,48 @@ class Orchestrator:
             print("\n[Step 10] Lip Sync Skipped (Disabled).")
             return final_video_path
 
+    def _needs_emotion_analysis(self, target_language, tone_preference):
+        """Runs the emotion/prosody analyzers only if something downstream reads their output."""
+        if Config.EMOTION_ANALYSIS == "always":
+            return True
+        if Config.EMOTION_ANALYSIS == "never":
+            return False
+        consumed = self.voice_cloner.analysis_fields(target_language)
+        if tone_preference:
+            consumed.discard("emotion") # The user's tone overrides the detected emotion
+        return bool(consumed)
+
+    def _match_known_voice(self, spk, spk_segments, video_path, claimed_voices):
+        """
+        Looks a diarized speaker up in the voice bank.
+        Returns (voice_id, embedding): voice_id is set on a match, otherwise the
+        embedding is returned so the new voice can be enrolled once its reference exists.
+        """
+        if not self.voice_bank or spk == "UNKNOWN":
+            return None, None
+
+        embedder = self.diarizer.get_embedder()
+        if embedder.backend not in VoiceBank.MATCHABLE_BACKENDS:
+            # MFCC statistics share a large component across all speech and cannot be
+            # normalised across videos, so unrelated voices would match. Never guess.
+            print(f"  [INFO] Voice bank needs neural speaker embeddings (HF_TOKEN); '{embedder.backend}' is not reliable enough. Skipping for {spk}.")
+            return None, None
+
+        try:
+            longest = sorted(spk_segments, key=lambda s: s['duration'], reverse=True)[:3]
+            embedding = embedder.embed_files([s['audio_path'] for s in longest])
+        except Exception as e:
+            print(f"  [WARNING] Speaker embedding failed for {spk}: {e}. Skipping voice bank.")
+            return None, None
+
+        threshold = Config.VOICE_BANK_THRESHOLD or embedder.threshold
+        voice_id, score = self.voice_bank.match(embedding, embedder.backend, threshold, exclude=claimed_voices)
+        if voice_id:
+            print(f"  Speaker {spk}: Matched known voice {voice_id} (similarity {score:.2f}). Reusing stored reference.")
+            self.voice_bank.update(voice_id, embedding, source=os.path.basename(video_path))
+            return voice_id, None
+        return None, embedding
+
     def cleanup_temp_files(self):
         print("Cleaning up temporary files...")
         import shutil